@@ -0,0 +1,115 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Overloaded(Exception):
+    """Raised when a turn can't be answered by the LLM within its deadline."""
+
+class AdmissionController:
+    """Limits concurrent LLM generations and sheds turns that would miss their deadline.
+
+    Every turn has a deadline (time.monotonic()). admit() waits for a free slot
+    until then, and picks a mode from the remaining budget and the recent
+    generation time of each mode: "full" if a normal answer fits, "degraded"
+    (shorter answer) if only that fits, otherwise the turn is shed. An
+    estimate not refreshed for probe_interval seconds is ignored once, so a
+    mode that was ruled out under load is tried again when load drops.
+    max_concurrent=0 means no concurrency limit. Optional work such as
+    speculation takes a slot with try_acquire() instead, which never waits.
+    """
+
+    def __init__(self, max_concurrent=0, smoothing=0.2, probe_interval=30):
+        self.max_concurrent = max_concurrent
+        self.smoothing = smoothing
+        self.probe_interval = probe_interval
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        # Moving average of generation seconds per mode; None until first seen
+        self.estimates = {"full": None, "degraded": None}
+        self.estimated_at = {"full": 0.0, "degraded": 0.0}
+        self.admitted = 0
+        self.degraded = 0
+        self.shed = 0
+
+    def _has_slot(self):
+        return not self.max_concurrent or self.active < self.max_concurrent
+
+    def _mode(self, remaining):
+        now = time.monotonic()
+        for mode in ("full", "degraded"):
+            estimate = self.estimates[mode]
+            if estimate is None or remaining >= estimate:
+                return mode
+            if now - self.estimated_at[mode] >= self.probe_interval:
+                # Only one turn probes; the rest keep using the old estimate
+                self.estimated_at[mode] = now
+                return mode
+        return None
+
+    def admit(self, deadline):
+        """Wait for a slot and return the generation mode, or raise Overloaded."""
+        with self.condition:
+            self.waiting += 1
+            try:
+                has_slot = self.condition.wait_for(self._has_slot, timeout=max(0.0, deadline - time.monotonic()))
+            finally:
+                self.waiting -= 1
+            mode = self._mode(deadline - time.monotonic()) if has_slot else None
+            if mode is None:
+                self.shed += 1
+                # Pass the wake-up on to the next waiter
+                self.condition.notify()
+                raise Overloaded("no LLM capacity within the turn deadline")
+            self.active += 1
+            self.admitted += 1
+            if mode == "degraded":
+                self.degraded += 1
+            return mode
+
+    def try_acquire(self):
+        """Take a slot only if one is free and no turn is waiting for it."""
+        with self.condition:
+            if self.waiting or not self._has_slot():
+                return False
+            self.active += 1
+            return True
+
+    def release(self, mode=None, elapsed=None):
+        """Free a slot, recording how long the generation took if it finished."""
+        with self.condition:
+            self.active -= 1
+            if elapsed is not None:
+                self._observe(mode, elapsed)
+            self.condition.notify()
+
+    def observe(self, mode, elapsed):
+        """Record how long a turn took to answer when its slot is released later."""
+        with self.condition:
+            self._observe(mode, elapsed)
+
+    def _observe(self, mode, elapsed):
+        estimate = self.estimates[mode]
+        self.estimates[mode] = elapsed if estimate is None else (
+            estimate + self.smoothing * (elapsed - estimate)
+        )
+        self.estimated_at[mode] = time.monotonic()
+
+    def saturated(self):
+        """Whether new work would have to queue for a slot."""
+        with self.condition:
+            return self.waiting > 0 or not self._has_slot()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "degraded": self.degraded,
+                "shed": self.shed,
+                "full_estimate": self.estimates["full"],
+                "degraded_estimate": self.estimates["degraded"],
+            }
@@ -0,0 +1,250 @@
+"""Durable archive of call events received over MQTT.
+
+Events are written behind to a SQLite database in WAL mode: the MQTT
+callback only appends to an in-memory buffer, and a writer thread commits
+them in batches. Indexes on CallSid, type and time keep transcript and
+time-range queries fast.
+
+    python archive.py run --db call_events.db
+    python archive.py transcript CA0123... --db call_events.db
+    python archive.py range "2024-01-01 09:00:00" "2024-01-01 17:00:00"
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    call_sid TEXT,
+    type TEXT,
+    ts REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_call_sid ON events (call_sid, ts);
+CREATE INDEX IF NOT EXISTS events_type ON events (type, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+"""
+
+def parse_timestamp(value):
+    """Epoch seconds for a message timestamp, or None if it can't be parsed."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class EventArchive:
+    """Batched write-behind store for MQTT call events.
+
+    record(data) is safe to call from the MQTT network thread; it never
+    touches the database. Up to max_pending events are buffered, after which
+    the oldest are dropped and counted.
+    """
+
+    def __init__(self, path="call_events.db", batch_size=500, flush_interval=0.5, max_pending=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.writing = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        self.writer = threading.Thread(target=self._write_loop, name="archive-writer", daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL makes NORMAL durable against application crashes, at far lower cost than FULL
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, data):
+        """Queue an event for the next write batch."""
+        received_at = time.time()
+        with self.condition:
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append((data, received_at))
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+    def _next_batch(self):
+        with self.condition:
+            if len(self.pending) < self.batch_size and not self.stopping:
+                self.condition.wait(self.flush_interval)
+            batch = [self.pending.popleft() for _ in range(min(len(self.pending), self.batch_size))]
+            self.writing = len(batch)
+            return batch
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch:
+                    rows = [
+                        (
+                            data.get("CallSid"),
+                            data.get("type"),
+                            parse_timestamp(data.get("timestamp")) or received_at,
+                            json.dumps(data, default=str),
+                        )
+                        for data, received_at in batch
+                    ]
+                    try:
+                        with conn:
+                            conn.executemany(
+                                "INSERT INTO events (call_sid, type, ts, payload) VALUES (?, ?, ?, ?)", rows
+                            )
+                    except sqlite3.Error as e:
+                        logger.error(f"Failed to archive {len(rows)} events: {e}")
+                        with self.condition:
+                            self.dropped += len(rows)
+                    else:
+                        with self.condition:
+                            self.written += len(rows)
+                            self.batches += 1
+                with self.condition:
+                    self.writing = 0
+                    self.condition.notify_all()
+                    if self.stopping and not self.pending:
+                        break
+        finally:
+            conn.close()
+
+    def flush(self, timeout=10):
+        """Wait until everything recorded so far has been written."""
+        with self.condition:
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: not self.pending and not self.writing, timeout)
+
+    def close(self, timeout=10):
+        """Write out the buffer and stop the writer thread."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.writer.join(timeout)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "pending": len(self.pending),
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+            }
+
+    def _query(self, where, params, limit=None):
+        sql = f"SELECT payload FROM events {where} ORDER BY ts, id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return [json.loads(payload) for (payload,) in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def transcript(self, call_sid):
+        """Every archived event of a call, in order."""
+        return self._query("WHERE call_sid = ?", (call_sid,))
+
+    def events(self, start=None, end=None, call_sid=None, msg_type=None, limit=None):
+        """Archived events in a time range, optionally for one call or message type.
+
+        start and end are epoch seconds or "YYYY-MM-DD HH:MM:SS" strings; end is exclusive.
+        """
+        clauses, params = [], []
+        if call_sid:
+            clauses.append("call_sid = ?")
+            params.append(call_sid)
+        if msg_type:
+            clauses.append("type = ?")
+            params.append(msg_type)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(parse_timestamp(start))
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(parse_timestamp(end))
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._query(where, params, limit)
+
+def run(args):
+    from mqtt_handler import MQTTHandler
+
+    archive = EventArchive(args.db, batch_size=args.batch_size, flush_interval=args.flush_interval)
+    mqtt_handler = MQTTHandler.from_env(
+        "call-archiver",
+        # Several archivers can split the stream between them; the dashboard still sees everything
+        consumer_group=os.getenv("ARCHIVE_CONSUMER_GROUP") or None,
+        queue_messages=False
+    )
+    mqtt_handler.add_listener(archive.record)
+    mqtt_handler.connect()
+    logger.warning(f"Archiving MQTT events to {args.db}")
+    try:
+        while True:
+            time.sleep(60)
+            logger.warning(f"Archive stats: {archive.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mqtt_handler.disconnect()
+        archive.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive call events from MQTT and query them.")
+    parser.add_argument("--db", default=os.getenv("ARCHIVE_DB", "call_events.db"), help="SQLite database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="subscribe to MQTT and archive events")
+    run_parser.add_argument("--batch-size", type=int, default=500, help="events per write transaction")
+    run_parser.add_argument("--flush-interval", type=float, default=0.5, help="max seconds before a partial batch is written")
+    transcript_parser = commands.add_parser("transcript", help="print every event of a call")
+    transcript_parser.add_argument("call_sid")
+    range_parser = commands.add_parser("range", help="print events between two timestamps")
+    range_parser.add_argument("start", help='"YYYY-MM-DD HH:MM:SS"')
+    range_parser.add_argument("end", help='"YYYY-MM-DD HH:MM:SS"')
+    range_parser.add_argument("--type", dest="msg_type", help="only this message type")
+    range_parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        # One INFO line per received message would dominate the archiver's work
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        from log_config import setup_logging
+        setup_logging()
+        run(args)
+        return
+
+    archive = EventArchive(args.db)
+    if args.command == "transcript":
+        events = archive.transcript(args.call_sid)
+    else:
+        events = archive.events(args.start, args.end, msg_type=args.msg_type, limit=args.limit)
+    archive.close()
+    for event in events:
+        print(json.dumps(event))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+import metrics
+import twilio_server
+
+logger = logging.getLogger(__name__)
+
+# Blocking work (LLM calls, TwiML construction) runs on a bounded pool so
+# slow turns never pile up more threads than this
+llm_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ASGI_LLM_WORKERS", 32)),
+    thread_name_prefix="llm"
+)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Lifespan runs on the server's main thread, where signal handlers can be set
+    twilio_server.profiler.install_signal_handler()
+    twilio_server.warm_up_in_background()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+async def run_blocking(func, *args):
+    """Run a blocking handler on the LLM executor."""
+    return await asyncio.get_running_loop().run_in_executor(llm_executor, func, *args)
+
+def twiml_response(body, status):
+    return Response(content=body, status_code=status, media_type="application/xml")
+
+@app.post("/status_callback")
+async def status_callback(request: Request):
+    """Handle Twilio call status updates and recording completions."""
+    data = dict(await request.form())
+    body, status = await run_blocking(twilio_server.handle_status_update, data)
+    return JSONResponse(body, status_code=status)
+
+@app.post("/process-input")
+async def process_input(request: Request):
+    """Process voice and DTMF input from Twilio."""
+    content_type = str(request.headers.get('Content-Type')).lower()
+
+    with twilio_server.STAGE_LATENCY.time(stage="parse"):
+        if 'application/json' in content_type:
+            data = await request.json()
+        elif 'application/x-www-form-urlencoded' in content_type:
+            data = dict(await request.form())
+        else:
+            data = None
+    if data is None:
+        logger.warning(f"Received unsupported Content-Type: {content_type}")
+        return JSONResponse({"error": f"Unsupported Content-Type: {content_type}"}, status_code=415)
+
+    received_at = time.monotonic()
+
+    def handle():
+        # Time spent waiting for a free worker, published with the user_input message
+        data['queue_time_ms'] = round((time.monotonic() - received_at) * 1000, 2)
+        logger.info("process-input for %s waited %s ms for a worker", data.get('CallSid'), data['queue_time_ms'])
+        return twilio_server.handle_input(data, received_at)
+
+    body, status = await run_blocking(handle)
+    return twiml_response(body, status)
+
+@app.post("/retry-input")
+async def retry_input(request: Request):
+    """Retry a turn that was deferred under load; the input is in the query string."""
+    data = dict(await request.form())
+    data.update(request.query_params)
+    received_at = time.monotonic()
+
+    def handle():
+        data['queue_time_ms'] = round((time.monotonic() - received_at) * 1000, 2)
+        return twilio_server.handle_input(data, received_at)
+
+    body, status = await run_blocking(handle)
+    return twiml_response(body, status)
+
+@app.post("/partial-speech")
+async def partial_speech(request: Request):
+    """Receive Gather partial transcripts and speculate on the answer."""
+    data = dict(await request.form())
+    body, status = await run_blocking(twilio_server.handle_partial_speech, data)
+    return JSONResponse(body, status_code=status)
+
+@app.post("/continue-response")
+async def continue_response(request: Request):
+    """Serve the remaining sentences of a streaming response."""
+    form = await request.form()
+    body, status = await run_blocking(twilio_server.handle_continue, form.get('CallSid'))
+    return twiml_response(body, status)
+
+@app.post("/admin/profile")
+async def admin_profile(request: Request):
+    """Control the sampling profiler; requires the X-Admin-Token header."""
+    if 'application/json' in str(request.headers.get('Content-Type')).lower():
+        data = await request.json()
+    else:
+        data = dict(await request.form())
+    body, status = await run_blocking(
+        twilio_server.handle_profile_command, request.headers.get('X-Admin-Token'), data
+    )
+    return JSONResponse(body, status_code=status)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Expose latency histograms and counters in Prometheus text format."""
+    return Response(content=twilio_server.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
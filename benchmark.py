@@ -0,0 +1,234 @@
+"""Load test for the webhook server against local stand-ins.
+
+Runs the real Flask app on a local port, points it at a fake Ollama server
+with configurable latency and token rate, and replaces the MQTT client with
+an in-process broker stand-in. Publish lag is the time a message waits in
+MQTTHandler's publish queue before reaching the broker.
+Simulated calls post status callbacks and speech turns concurrently, and the
+run reports turn latency percentiles, throughput and MQTT publish lag.
+
+    python benchmark.py --calls 50 --concurrency 50 --turns 3
+    python benchmark.py --save-baseline      # store the result as the baseline
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASELINE_PATH = "benchmark_baselines.json"
+
+REPLY = "Thanks for calling. Our office is open from nine to five, Monday through Friday. Is there anything else I can help with?"
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def make_fake_ollama(first_token_latency, tokens_per_second):
+    """HTTP handler imitating Ollama's /api/generate and /api/chat endpoints."""
+
+    class FakeOllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _chunk(self, payload):
+            body = (json.dumps(payload) + "\n").encode()
+            self.wfile.write(f"{len(body):x}\r\n".encode() + body + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            is_chat = self.path.startswith("/api/chat")
+            prompt = request.get("prompt", "") if not is_chat else "chat"
+            options = request.get("options") or {}
+            words = REPLY.split(" ")
+            if options.get("num_predict"):
+                words = words[:options["num_predict"]]
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            base = {"model": request.get("model"), "created_at": datetime.now(timezone.utc).isoformat()}
+            if prompt:
+                time.sleep(first_token_latency)
+                for index, word in enumerate(words):
+                    token = word if index == 0 else " " + word
+                    chunk = {"message": {"role": "assistant", "content": token}} if is_chat else {"response": token}
+                    self._chunk({**base, **chunk, "done": False})
+                    time.sleep(1 / tokens_per_second)
+            final = {"message": {"role": "assistant", "content": ""}} if is_chat else {"response": ""}
+            self._chunk({**base, **final, "done": True, "done_reason": "stop", "eval_count": len(words)})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return FakeOllamaHandler
+
+class LocalBroker:
+    """Stand-in for the paho client that counts publishes, with optional broker delay."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def publish(self, topic, payload, qos=0, properties=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.count += 1
+        return None
+
+    # Calls made by MQTTHandler during connect/disconnect
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+def start_servers(args):
+    """Start the fake Ollama server and the Flask app; return the app's base URL."""
+    ollama_server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), make_fake_ollama(args.llm_latency, args.token_rate)
+    )
+    threading.Thread(target=ollama_server.serve_forever, daemon=True).start()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{ollama_server.server_address[1]}"
+    os.environ.setdefault("NGROK_URL", "http://127.0.0.1")
+
+    # Imported after the environment points at the stand-ins
+    import twilio_server
+    from mqtt_handler import MQTTHandler
+    from werkzeug.serving import make_server
+
+    broker = LocalBroker(latency=args.broker_latency)
+    mqtt_handler = MQTTHandler(
+        client_id="benchmark",
+        async_publish=os.getenv("MQTT_ASYNC_PUBLISH", "true").lower() == "true"
+    )
+    mqtt_handler.client = broker
+    mqtt_handler.connected = True
+    if mqtt_handler.async_publish:
+        mqtt_handler.start_publish_worker()
+    twilio_server.mqtt_component.reset(mqtt_handler)
+    twilio_server.warm_up()
+
+    server = make_server("127.0.0.1", 0, twilio_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", mqtt_handler, broker
+
+def simulate_call(base_url, index, turns, latencies, errors):
+    import requests
+    session = requests.Session()
+    call_sid = f"CAbench{index:06d}"
+    for status in ("initiated", "ringing", "in-progress"):
+        session.post(f"{base_url}/status_callback", data={"CallSid": call_sid, "CallStatus": status})
+    for turn in range(turns):
+        start = time.perf_counter()
+        response = session.post(
+            f"{base_url}/process-input",
+            data={"CallSid": call_sid, "SpeechResult": f"Question {turn} from caller {index}"}
+        )
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+    session.post(f"{base_url}/status_callback", data={"CallSid": call_sid, "CallStatus": "completed"})
+
+def run(args):
+    base_url, mqtt_handler, broker = start_servers(args)
+    latencies, errors = [], []
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(simulate_call, base_url, index, args.turns, latencies, errors)
+            for index in range(args.calls)
+        ]
+    elapsed = time.perf_counter() - start
+    # A call that raised (connection refused, timeout) counts as an error
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(repr(e))
+
+    # Let the publish worker drain before reading its lag
+    deadline = time.monotonic() + 10
+    while mqtt_handler.async_publish and mqtt_handler.publish_stats()["queue_depth"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    publish_stats = mqtt_handler.publish_stats() if mqtt_handler.async_publish else {}
+
+    return {
+        "turns": len(latencies),
+        "errors": len(errors),
+        "elapsed": round(elapsed, 3),
+        "turns_per_sec": round(len(latencies) / elapsed, 2),
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+        "p99": round(percentile(latencies, 99), 4),
+        "mqtt_published": broker.count,
+        "publish_lag_avg": round(publish_stats.get("avg_latency", 0.0), 4),
+        "publish_lag_max": round(publish_stats.get("max_latency", 0.0), 4),
+    }
+
+def compare(result, baseline, tolerance):
+    """Return the metrics that regressed by more than tolerance against the baseline."""
+    regressions = []
+    for key in ("p50", "p95", "p99", "publish_lag_avg"):
+        if baseline.get(key) and result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]} -> {result[key]}")
+    if baseline.get("turns_per_sec") and result["turns_per_sec"] < baseline["turns_per_sec"] * (1 - tolerance):
+        regressions.append(f"turns_per_sec: {baseline['turns_per_sec']} -> {result['turns_per_sec']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the webhook server against local stand-ins.")
+    parser.add_argument("--calls", type=int, default=50, help="simulated calls")
+    parser.add_argument("--concurrency", type=int, default=50, help="calls in progress at once")
+    parser.add_argument("--turns", type=int, default=3, help="speech turns per call")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake Ollama time to first token (s)")
+    parser.add_argument("--token-rate", type=float, default=200, help="fake Ollama tokens per second")
+    parser.add_argument("--broker-latency", type=float, default=0.0, help="broker stand-in publish delay (s)")
+    parser.add_argument("--scenario", default="default", help="name the baseline is stored under")
+    parser.add_argument("--baseline-file", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression before failing")
+    args = parser.parse_args()
+
+    # Keep per-request logging out of the measurements
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    baselines = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[args.scenario] = result
+        with open(args.baseline_file, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved baseline for scenario '{args.scenario}'")
+    elif args.scenario in baselines:
+        regressions = compare(result, baselines[args.scenario], args.tolerance)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            raise SystemExit(1)
+        print("No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Order in which Twilio moves a call through its lifecycle. Status callbacks
+# can arrive out of order, so a call never moves back to an earlier rank.
+STATUS_RANK = {
+    "queued": 0,
+    "initiated": 1,
+    "ringing": 2,
+    "in-progress": 3,
+    "answered": 3,
+    "completed": 4,
+    "busy": 4,
+    "failed": 4,
+    "no-answer": 4,
+    "canceled": 4,
+}
+
+TERMINAL_STATUSES = ("completed", "failed", "busy", "no-answer", "canceled")
+
+class CallState:
+    def __init__(self, call_sid, status="queued"):
+        self.call_sid = call_sid
+        self.status = status
+        self.history = [status]
+        self.duration = None
+        self.updated_at = time.monotonic()
+        self.last_fetch = 0.0
+        # Only calls placed by this client fall back to REST fetches
+        self.tracked = False
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+class CallStateTracker:
+    """Tracks call status per CallSid from MQTT status_update events.
+
+    Any other event carrying a CallSid (user_input, agent_response) shows
+    the call is still live. A REST fetch is only used as a fallback for
+    calls placed through track() that have not produced an event for
+    fallback_timeout seconds.
+    """
+
+    def __init__(self, fallback_timeout=30, max_finished=500):
+        self.fallback_timeout = fallback_timeout
+        self.max_finished = max_finished
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def track(self, call_sid, status="queued"):
+        """Start tracking a call placed by this client."""
+        with self.lock:
+            if call_sid not in self.calls:
+                self.calls[call_sid] = CallState(call_sid, status)
+            self.calls[call_sid].tracked = True
+            return self.calls[call_sid]
+
+    def _apply(self, call_sid, status, duration=None):
+        state = self.calls.get(call_sid)
+        if state is None:
+            state = self.calls[call_sid] = CallState(call_sid, status)
+        elif STATUS_RANK.get(status, -1) >= STATUS_RANK.get(state.status, -1):
+            if status != state.status:
+                state.status = status
+                state.history.append(status)
+        else:
+            logger.debug(f"Ignoring out-of-order status {status} for call {call_sid}")
+        if duration is not None:
+            state.duration = duration
+        state.updated_at = time.monotonic()
+        return state
+
+    def handle_message(self, message):
+        """MQTT listener: apply status_update messages to the state machine."""
+        call_sid = message.get('CallSid')
+        if message.get('type') != 'status_update':
+            # Conversation events only show the call is live; they carry no status
+            if call_sid:
+                with self.lock:
+                    state = self.calls.get(call_sid)
+                    if state is not None:
+                        state.updated_at = time.monotonic()
+            return
+        status = message.get('CallStatus')
+        if not call_sid or not status:
+            return
+        with self.lock:
+            self._apply(call_sid, status, message.get('CallDuration'))
+            self._prune()
+
+    def _prune(self):
+        finished = [sid for sid, state in self.calls.items() if state.finished]
+        for call_sid in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.calls[call_sid]
+
+    def get(self, call_sid):
+        with self.lock:
+            return self.calls.get(call_sid)
+
+    def active_calls(self):
+        with self.lock:
+            return [state for state in self.calls.values() if not state.finished]
+
+    def refresh_stale(self, fetch_status):
+        """Fall back to fetch_status(call_sid) for tracked calls with no recent events.
+
+        Each call is fetched at most once per fallback_timeout.
+        """
+        now = time.monotonic()
+        with self.lock:
+            stale = [
+                state.call_sid for state in self.calls.values()
+                if state.tracked and not state.finished
+                and now - state.updated_at >= self.fallback_timeout
+                and now - state.last_fetch >= self.fallback_timeout
+            ]
+            for call_sid in stale:
+                self.calls[call_sid].last_fetch = now
+        for call_sid in stale:
+            try:
+                status = fetch_status(call_sid)
+            except Exception as e:
+                logger.error(f"Fallback status fetch failed for call {call_sid}: {e}")
+                continue
+            logger.info(f"Fetched status for call {call_sid} after no events: {status}")
+            with self.lock:
+                self._apply(call_sid, status)
+        return stale
@@ -0,0 +1,214 @@
+import argparse
+import csv
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import requests
+from twilio.base.exceptions import TwilioRestException
+from urllib3.exceptions import NewConnectionError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or 1
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class DryRunTwilioHandler:
+    """Stand-in for TwilioHandler that simulates call creation without dialing."""
+
+    class Call:
+        def __init__(self):
+            self.sid = f"CA{uuid.uuid4().hex}"
+            self.status = "queued"
+
+    def __init__(self, latency=0.2, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def validate_phone_number(self, phone):
+        return phone and phone.startswith('+') and len(phone) >= 10
+
+    def make_call(self, to_number):
+        if not self.validate_phone_number(to_number):
+            raise ValueError("Invalid phone number format")
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise TwilioRestException(503, "dry-run", msg="Simulated service unavailable")
+        return self.Call()
+
+    def find_calls(self, to_number, since):
+        # Simulated failures never create a call
+        return []
+
+def is_connect_error(error):
+    """Whether the request failed before reaching Twilio, so no call was created."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+def classify_error(error):
+    """Sort a make_call failure into "retry", "unknown" or "failed".
+
+    calls.create isn't idempotent, so only rate limits and connection
+    failures are retried blindly. Server errors and timeouts may have
+    created the call anyway; they are "unknown" until checked against
+    Twilio's call log.
+    """
+    if isinstance(error, TwilioRestException):
+        if error.status == 429:
+            return "retry"
+        return "unknown" if error.status >= 500 else "failed"
+    if isinstance(error, ValueError):
+        return "failed"
+    return "retry" if is_connect_error(error) else "unknown"
+
+def read_numbers(path):
+    """Read E.164 numbers from the first column of a CSV file, skipping a header."""
+    numbers = []
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if row and row[0].strip().startswith('+'):
+                numbers.append(row[0].strip())
+    return numbers
+
+class CampaignDialer:
+    """Dials a list of numbers through a thread pool under a shared rate limit.
+
+    Results are appended to a progress CSV as they complete so an interrupted
+    campaign can be resumed without redialing numbers already handled. A
+    number whose call may or may not have been placed is recorded as
+    "unknown" and left for the operator to check rather than redialed.
+    """
+
+    def __init__(self, twilio_handler, rate=1.0, workers=8, max_retries=3,
+                 backoff=1.0, progress_path=None):
+        self.twilio = twilio_handler
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.progress_path = progress_path
+        self.lock = threading.Lock()
+        self.stats = {"called": 0, "failed": 0, "unknown": 0, "retries": 0, "skipped": 0}
+
+    def load_progress(self):
+        """Return the numbers already recorded in the progress file."""
+        if not self.progress_path or not os.path.exists(self.progress_path):
+            return set()
+        with open(self.progress_path, newline='') as f:
+            return {row[0] for row in csv.reader(f) if row}
+
+    def record(self, number, status, call_sid="", error=""):
+        with self.lock:
+            self.stats[status] += 1
+            if self.progress_path:
+                with open(self.progress_path, 'a', newline='') as f:
+                    csv.writer(f).writerow([number, status, call_sid, error])
+
+    def dial(self, number):
+        """Place one call, retrying transient failures with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            # Allow for clock skew between this host and Twilio
+            attempted_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+            try:
+                call = self.twilio.make_call(number)
+                self.record(number, "called", call.sid)
+                return
+            except Exception as e:
+                outcome = classify_error(e)
+                if outcome == "unknown":
+                    # Only redial once Twilio confirms the failed request created no call
+                    try:
+                        calls = self.twilio.find_calls(number, attempted_at)
+                    except Exception as lookup_error:
+                        logger.error(f"Couldn't check whether {number} was called after error {e}: {lookup_error}")
+                        self.record(number, "unknown", error=str(e))
+                        return
+                    if calls:
+                        logger.warning(f"Call to {number} was placed despite error: {e}")
+                        self.record(number, "called", calls[0].sid)
+                        return
+                if outcome == "failed" or attempt == self.max_retries:
+                    logger.error(f"Failed to call {number}: {e}")
+                    self.record(number, "failed", error=str(e))
+                    return
+                with self.lock:
+                    self.stats["retries"] += 1
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logger.warning(f"Retrying {number} in {delay:.1f}s after error: {e}")
+                time.sleep(delay)
+
+    def run(self, numbers):
+        """Dial every number not already in the progress file and return the stats."""
+        done = self.load_progress()
+        pending = [number for number in numbers if number not in done]
+        self.stats["skipped"] = len(numbers) - len(pending)
+        logger.info(f"Dialing {len(pending)} numbers ({self.stats['skipped']} already done)")
+
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dialer") as pool:
+            list(pool.map(self.dial, pending))
+        elapsed = time.monotonic() - started_at
+
+        self.stats["elapsed"] = round(elapsed, 2)
+        self.stats["calls_per_sec"] = round(self.stats["called"] / elapsed, 2) if elapsed else 0.0
+        logger.info(f"Campaign finished: {self.stats}")
+        return self.stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Dial a CSV of E.164 numbers.")
+    parser.add_argument("csv_path", help="CSV file with one phone number per row")
+    parser.add_argument("--rate", type=float, default=1.0, help="calls per second (account CPS limit)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent dialing threads")
+    parser.add_argument("--max-retries", type=int, default=3, help="retries for transient failures")
+    parser.add_argument("--backoff", type=float, default=1.0, help="base retry delay in seconds")
+    parser.add_argument("--progress", default="campaign_progress.csv", help="progress file used to resume")
+    parser.add_argument("--dry-run", action="store_true", help="simulate calls without contacting Twilio")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        twilio_handler = DryRunTwilioHandler()
+    else:
+        from twilio_handler import TwilioHandler
+        twilio_handler = TwilioHandler(pool_size=args.workers)
+
+    dialer = CampaignDialer(
+        twilio_handler,
+        rate=args.rate,
+        workers=args.workers,
+        max_retries=args.max_retries,
+        backoff=args.backoff,
+        progress_path=args.progress
+    )
+    dialer.run(read_numbers(args.csv_path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# What the server does with a matched intent
+ACTIONS = ("say", "replay", "hangup", "transfer")
+
+# "exact": the whole utterance is the phrase; "contains": the phrase appears anywhere in it
+MATCH_MODES = ("exact", "contains")
+
+# Actions that can't be taken back default to exact matching, so a phrase
+# inside a longer question doesn't transfer the call or skip the question
+EXACT_BY_DEFAULT = ("replay", "transfer")
+
+class Intent:
+    def __init__(self, name, action, phrases=(), message=None, number=None, match=None):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action for intent {name}: {action}")
+        if match is None:
+            match = "exact" if action in EXACT_BY_DEFAULT else "contains"
+        if match not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode for intent {name}: {match}")
+        self.name = name
+        self.action = action
+        self.phrases = list(phrases)
+        self.message = message
+        self.number = number
+        self.match = match
+
+class IntentRouter:
+    """Answers common caller turns from config without calling the LLM.
+
+    Phrases are normalized with normalize() and compiled into a word-level
+    trie, so matching costs a short trie walk from each word of the utterance
+    no matter how many phrases are configured. Digits are looked up in a DTMF menu map.
+    When several phrases match, the longest wins.
+    """
+
+    def __init__(self, intents=(), dtmf=None, normalize=str.lower):
+        self.normalize = normalize
+        self.intents = {intent.name: intent for intent in intents}
+        self.dtmf = {}
+        self.trie = {}
+        self.lock = threading.Lock()
+        self.turns = 0
+        self.routed = {}
+        for intent in intents:
+            for phrase in intent.phrases:
+                self._add_phrase(phrase, intent)
+        for digits, name in (dtmf or {}).items():
+            if name not in self.intents:
+                raise ValueError(f"DTMF {digits} maps to unknown intent: {name}")
+            self.dtmf[digits] = self.intents[name]
+
+    def _add_phrase(self, phrase, intent):
+        words = self.normalize(phrase).split()
+        if not words:
+            return
+        node = self.trie
+        for word in words:
+            node = node.setdefault(word, {})
+        # None is never a word, so it can mark the end of a phrase
+        node[None] = intent
+
+    @classmethod
+    def from_file(cls, path, normalize=str.lower):
+        """Build a router from a JSON config; environment variables in values are expanded."""
+        with open(path) as f:
+            config = json.load(f)
+        intents = []
+        for entry in config.get("intents", []):
+            number = os.path.expandvars(entry["number"]) if entry.get("number") else None
+            if entry["action"] == "transfer" and (not number or "$" in number):
+                logger.warning(f"Intent {entry['name']} has no transfer number, leaving it to the LLM")
+                continue
+            intent = Intent(
+                entry["name"],
+                entry["action"],
+                phrases=entry.get("phrases", []),
+                message=entry.get("message"),
+                number=number,
+                match=entry.get("match")
+            )
+            intents.append(intent)
+        known = {intent.name for intent in intents}
+        dtmf = {digits: name for digits, name in config.get("dtmf", {}).items() if name in known}
+        return cls(intents, dtmf, normalize)
+
+    def _match_speech(self, text):
+        words = self.normalize(text).split()
+        best, best_length = None, 0
+        for start in range(len(words)):
+            node = self.trie
+            for end in range(start, len(words)):
+                node = node.get(words[end])
+                if node is None:
+                    break
+                intent = node.get(None)
+                length = end - start + 1
+                if intent is None or length <= best_length:
+                    continue
+                if intent.match == "exact" and (start > 0 or end < len(words) - 1):
+                    continue
+                best, best_length = intent, length
+        return best
+
+    def route(self, speech_result, digits):
+        """Return the Intent that answers this turn, or None to use the LLM."""
+        if digits:
+            intent = self.dtmf.get(digits)
+        elif speech_result and self.trie:
+            intent = self._match_speech(speech_result)
+        else:
+            intent = None
+        with self.lock:
+            self.turns += 1
+            if intent is not None:
+                self.routed[intent.name] = self.routed.get(intent.name, 0) + 1
+        return intent
+
+    def stats(self):
+        """Turns seen, turns answered per intent and the share answered without the LLM."""
+        with self.lock:
+            routed = sum(self.routed.values())
+            return {
+                "turns": self.turns,
+                "routed": dict(self.routed),
+                "share": routed / self.turns if self.turns else 0.0,
+            }
@@ -0,0 +1,99 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StartupReport:
+    """Records how long each startup phase took and whether it succeeded."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def record(self, phase, seconds, error=None):
+        with self.lock:
+            self.phases[phase] = {
+                "seconds": round(seconds, 4),
+                "ok": error is None,
+                "error": error,
+            }
+        if error:
+            logger.warning(f"Startup phase {phase} failed after {seconds:.3f}s: {error}")
+        else:
+            logger.info(f"Startup phase {phase} took {seconds:.3f}s")
+
+    def phase(self, name):
+        """Context manager timing a block as one phase."""
+        return _TimedPhase(self, name)
+
+    @property
+    def degraded(self):
+        with self.lock:
+            return any(not phase["ok"] for phase in self.phases.values())
+
+    def summary(self):
+        with self.lock:
+            return {
+                "status": "degraded" if any(not p["ok"] for p in self.phases.values()) else "ok",
+                "uptime": round(time.monotonic() - self.started_at, 1),
+                "phases": dict(self.phases),
+            }
+
+class _TimedPhase:
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.report.record(self.name, time.perf_counter() - self.start, str(exc) if exc else None)
+        return False
+
+class LazyComponent:
+    """Thread-safe singleton built by factory() on first use.
+
+    If the factory fails, get() returns None (degraded mode) and the factory
+    is retried at most once per retry_interval seconds.
+    """
+
+    def __init__(self, name, factory, report=None, retry_interval=30):
+        self.name = name
+        self.factory = factory
+        self.report = report
+        self.retry_interval = retry_interval
+        self.value = None
+        self.ready = False
+        self.next_retry = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.ready:
+            return self.value
+        if time.monotonic() < self.next_retry:
+            return None
+        with self.lock:
+            if self.ready or time.monotonic() < self.next_retry:
+                return self.value
+            start = time.perf_counter()
+            try:
+                self.value = self.factory()
+                self.ready = True
+                error = None
+            except Exception as e:
+                self.next_retry = time.monotonic() + self.retry_interval
+                error = str(e)
+            if self.report:
+                self.report.record(self.name, time.perf_counter() - start, error)
+            return self.value
+
+    def reset(self, value=None):
+        """Replace the component, e.g. with a stand-in."""
+        with self.lock:
+            self.value = value
+            self.ready = value is not None
+            self.next_retry = 0.0
@@ -0,0 +1,120 @@
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+# CallSid of the call being handled on the current thread, added to every record
+call_sid_var = contextvars.ContextVar("call_sid", default=None)
+
+# Set from LOG_PAYLOAD_MAX_CHARS and LOG_PAYLOAD_SAMPLE_RATE by setup_logging(),
+# which runs after .env is loaded
+PAYLOAD_MAX_CHARS = 512
+PAYLOAD_SAMPLE_RATE = 1.0
+
+_listener = None
+
+@contextlib.contextmanager
+def call_context(call_sid):
+    """Tag log records emitted inside the block with a CallSid."""
+    token = call_sid_var.set(call_sid)
+    try:
+        yield
+    finally:
+        call_sid_var.reset(token)
+
+class LogPayload:
+    """Lazily rendered message payload for log records.
+
+    Nothing is serialized unless the record is actually emitted. Payloads are
+    truncated to PAYLOAD_MAX_CHARS, and only a PAYLOAD_SAMPLE_RATE fraction of
+    them are rendered in full; the rest are summarized by type and CallSid.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        if PAYLOAD_SAMPLE_RATE < 1 and random.random() >= PAYLOAD_SAMPLE_RATE:
+            return f"<{self.data.get('type', 'message')} CallSid={self.data.get('CallSid')}>"
+        text = json.dumps(self.data, default=str)
+        if len(text) > PAYLOAD_MAX_CHARS:
+            return f"{text[:PAYLOAD_MAX_CHARS]}... ({len(text)} chars)"
+        return text
+
+class CallContextFilter(logging.Filter):
+    def filter(self, record):
+        if not hasattr(record, "call_sid"):
+            record.call_sid = call_sid_var.get()
+        return True
+
+class MessageOnlyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that only merges the message on the logging thread.
+
+    Full formatting (timestamps, JSON encoding) happens on the listener thread.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "call_sid": getattr(record, "call_sid", None),
+            "msg": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def setup_logging(level=None, log_format=None):
+    """Route all logging through a queue drained by a background listener thread.
+
+    Safe to call more than once; only the first call configures logging.
+    """
+    global _listener, PAYLOAD_MAX_CHARS, PAYLOAD_SAMPLE_RATE
+    if _listener is not None:
+        return
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    log_format = log_format or os.getenv("LOG_FORMAT", "text")
+    PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", PAYLOAD_MAX_CHARS))
+    PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", PAYLOAD_SAMPLE_RATE))
+
+    stream_handler = logging.StreamHandler()
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(call_sid)s] %(message)s"
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = MessageOnlyQueueHandler(log_queue)
+    queue_handler.addFilter(CallContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,123 @@
+import threading
+
+class SequenceIndex:
+    """Ascending list of sequence numbers with cheap trimming from the front."""
+
+    def __init__(self):
+        self.seqs = []
+        self.offset = 0
+
+    def append(self, seq):
+        self.seqs.append(seq)
+
+    def trim(self, min_seq):
+        while self.offset < len(self.seqs) and self.seqs[self.offset] < min_seq:
+            self.offset += 1
+        # Compact once the dead prefix dominates the list
+        if self.offset > 64 and self.offset * 2 > len(self.seqs):
+            del self.seqs[:self.offset]
+            self.offset = 0
+
+    def __len__(self):
+        return len(self.seqs) - self.offset
+
+    def slice(self, start, end):
+        return self.seqs[self.offset + start:self.offset + end]
+
+class MessageStore:
+    """Ring buffer of dashboard messages with indexes by CallSid and type.
+
+    Each message gets an increasing sequence number and lives in slot
+    seq % max_messages, so a page of the full history is a direct lookup.
+    Messages are formatted once on insert rather than on every rerun.
+    """
+
+    def __init__(self, max_messages=1000, formatter=None):
+        self.max_messages = max_messages
+        self.formatter = formatter
+        self.slots = [None] * max_messages
+        self.next_seq = 0
+        self.by_call = {}
+        self.by_type = {}
+        self.lock = threading.Lock()
+
+    @property
+    def first_seq(self):
+        return max(0, self.next_seq - self.max_messages)
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def _index(self, index, key, seq):
+        if key not in index:
+            index[key] = SequenceIndex()
+        index[key].append(seq)
+
+    def _evict(self, index, key):
+        entries = index.get(key)
+        if entries is not None:
+            entries.trim(self.first_seq)
+            if not entries:
+                del index[key]
+
+    def extend(self, messages):
+        """Append new messages, evicting the oldest beyond max_messages."""
+        with self.lock:
+            for msg in messages:
+                seq = self.next_seq
+                slot = seq % self.max_messages
+                evicted = self.slots[slot]
+                formatted = self.formatter(msg) if self.formatter else msg
+                self.slots[slot] = (msg, formatted)
+                self.next_seq += 1
+                if evicted is not None:
+                    self._evict(self.by_call, evicted[0].get('CallSid'))
+                    self._evict(self.by_type, evicted[0].get('type', 'unknown'))
+                if msg.get('CallSid'):
+                    self._index(self.by_call, msg['CallSid'], seq)
+                self._index(self.by_type, msg.get('type', 'unknown'), seq)
+
+    def _filtered(self, call_sid, msg_type):
+        index = self.by_call.get(call_sid)
+        if index is None:
+            return []
+        return [
+            seq for seq in index.slice(0, len(index))
+            if self.slots[seq % self.max_messages][0].get('type', 'unknown') == msg_type
+        ]
+
+    def count(self, call_sid=None, msg_type=None):
+        """Number of stored messages matching the filter."""
+        with self.lock:
+            if call_sid is None and msg_type is None:
+                return len(self)
+            if msg_type is None:
+                return len(self.by_call.get(call_sid, ()))
+            if call_sid is None:
+                return len(self.by_type.get(msg_type, ()))
+            return len(self._filtered(call_sid, msg_type))
+
+    def page(self, page, per_page, call_sid=None, msg_type=None):
+        """Return the formatted messages on a 1-based page, oldest first."""
+        start = (page - 1) * per_page
+        with self.lock:
+            if call_sid is None and msg_type is None:
+                seqs = range(self.first_seq + start, min(self.first_seq + start + per_page, self.next_seq))
+            elif msg_type is None:
+                index = self.by_call.get(call_sid)
+                seqs = index.slice(start, start + per_page) if index else []
+            elif call_sid is None:
+                index = self.by_type.get(msg_type)
+                seqs = index.slice(start, start + per_page) if index else []
+            else:
+                seqs = self._filtered(call_sid, msg_type)[start:start + per_page]
+            return [self.slots[seq % self.max_messages][1] for seq in seqs]
+
+    def call_sids(self):
+        """CallSids with stored messages, in order of first appearance."""
+        with self.lock:
+            return list(self.by_call)
+
+    def types(self):
+        with self.lock:
+            return list(self.by_type)
@@ -0,0 +1,69 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ModelKeeper:
+    """Keeps an Ollama model loaded and its system-prompt prefix evaluated.
+
+    Ollama reuses the KV cache for a prompt prefix it has already evaluated,
+    as long as the model stays loaded with the same options. warm_up() runs
+    the real prompt once at boot, and a background thread re-sends a load
+    request whenever the server has been idle for `interval` seconds so the
+    model is not unloaded between calls. `options` are the model options
+    (num_ctx etc.) the real requests use; pings send the same ones, since a
+    ping with different options would make Ollama reload the model.
+    """
+
+    def __init__(self, model, keep_alive="30m", interval=240, base_url=None, options=None):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.base_url = base_url
+        self.options = options or {}
+        self.last_used = time.monotonic()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.pings = 0
+
+    def touch(self):
+        """Record that the model just served a request."""
+        self.last_used = time.monotonic()
+
+    def warm_up(self, runnable, inputs):
+        """Run one throwaway inference so the first real turn hits a loaded model."""
+        start = time.perf_counter()
+        runnable.invoke(inputs)
+        self.touch()
+        logger.info(f"Warmed up {self.model} in {time.perf_counter() - start:.2f}s")
+
+    def ping(self):
+        """Ask Ollama to load the model (if needed) and reset its keep-alive timer."""
+        import ollama
+        client = ollama.Client(host=self.base_url) if self.base_url else ollama.Client()
+        client.generate(model=self.model, prompt="", keep_alive=self.keep_alive, options=self.options or None)
+        self.pings += 1
+        self.touch()
+
+    def start(self):
+        """Start the keep-alive scheduler thread."""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="ollama-keep-alive", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval / 4):
+            if time.monotonic() - self.last_used < self.interval:
+                continue
+            try:
+                self.ping()
+                logger.debug(f"Sent keep-alive for {self.model}")
+            except Exception as e:
+                logger.warning(f"Keep-alive request for {self.model} failed: {e}")
+                self.touch()
@@ -0,0 +1,44 @@
+import re
+
+# Words suggesting a turn needs more reasoning than a short conversational reply
+COMPLEX_MARKERS = frozenset({
+    "why", "explain", "compare", "difference", "calculate", "recommend", "describe",
+    "detail", "details", "detailed", "plan", "steps", "pros", "cons", "versus", "vs",
+    "analyze", "summarize", "problem", "issue", "troubleshoot", "policy", "refund",
+})
+
+WORD = re.compile(r"[\w']+")
+
+class ModelRouter:
+    """Sends simple turns to a small model and escalates the rest to a large one.
+
+    choose() returns (model, reason). A turn goes to the large model when it
+    is longer than max_words, when the call already has more than
+    max_history_turns exchanges, or when it asks several questions or uses a
+    word from complex_markers. With small_model=None every turn goes to the
+    large model.
+    """
+
+    def __init__(self, small_model, large_model, max_words=20, max_history_turns=6,
+                 complex_markers=COMPLEX_MARKERS):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.max_words = max_words
+        self.max_history_turns = max_history_turns
+        self.complex_markers = frozenset(complex_markers)
+
+    @property
+    def enabled(self):
+        return self.small_model is not None
+
+    def choose(self, text, chat_history=()):
+        if not self.enabled:
+            return self.large_model, "single_model"
+        words = WORD.findall(text.lower())
+        if len(words) > self.max_words:
+            return self.large_model, "length"
+        if sum(1 for role, _ in chat_history if role == "human") > self.max_history_turns:
+            return self.large_model, "history"
+        if text.count("?") > 1 or not self.complex_markers.isdisjoint(words):
+            return self.large_model, "complexity"
+        return self.small_model, "simple"
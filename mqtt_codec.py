@@ -0,0 +1,88 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# First byte of every encoded payload; bump when the framing changes
+FORMAT_VERSION = 1
+
+class JsonCodec:
+    name = "json"
+    content_type = "application/json"
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(",", ":")).encode()
+
+    def loads(self, body):
+        return json.loads(body)
+
+class OrjsonCodec(JsonCodec):
+    """Same wire format as JsonCodec, with faster serialization."""
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ValueError("The orjson codec requires the orjson package")
+
+    def dumps(self, data):
+        return orjson.dumps(data)
+
+    def loads(self, body):
+        return orjson.loads(body)
+
+class MsgpackCodec:
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("The msgpack codec requires the msgpack package")
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, body):
+        return msgpack.unpackb(body, raw=False)
+
+CODECS = {
+    "json": JsonCodec,
+    "orjson": OrjsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+def get_codec(name):
+    """Instantiate a codec by name."""
+    if name not in CODECS:
+        raise ValueError(f"Unknown MQTT codec: {name}")
+    return CODECS[name]()
+
+def decoder_for(content_type):
+    """Pick a codec able to decode the given MQTT v5 content type."""
+    if content_type == MsgpackCodec.content_type:
+        return MsgpackCodec()
+    if content_type == JsonCodec.content_type and orjson is not None:
+        return OrjsonCodec()
+    return JsonCodec()
+
+def encode(codec, data):
+    """Frame a message as a version byte followed by the codec body."""
+    return bytes([FORMAT_VERSION]) + codec.dumps(data)
+
+def decode(payload, content_type=None):
+    """Decode a payload according to its content type.
+
+    Payloads published without a content type are plain, unframed JSON.
+    """
+    if content_type is None:
+        return json.loads(payload)
+    version = payload[0]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported payload format version: {version}")
+    return decoder_for(content_type).loads(payload[1:])
@@ -1,22 +1,83 @@
 import paho.mqtt.client as mqtt
-import json
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
 from datetime import datetime
 import logging
-import streamlit as st
+import os
+from dotenv import load_dotenv
 from queue import Queue
+from collections import deque
 import threading
+import time
+import mqtt_codec
+from log_config import LogPayload, call_context
+from profiler import profiler
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# What to do with a new message when the async publish queue is full
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+# "flat" sends everything to one topic; "per-call" uses <prefix>/calls/<CallSid>/<type>
+TOPIC_SCHEMES = ("flat", "per-call")
+
 class MQTTHandler:
-    def __init__(self, client_id="streamlit-mqtt"):
+    def __init__(self, client_id="streamlit-mqtt", async_publish=False, publish_queue_size=1000,
+                 overflow_policy="drop_oldest", publish_batch_size=50, block_timeout=0.5,
+                 topic_prefix="itest", topic_scheme="flat", codec="json", subscriptions=None,
+                 consumer_group=None, max_inflight=None, queue_messages=True):
         self.broker = "broker.hivemq.com"
         self.port = 1883
-        self.topic = "itest/messages"
+        self.topic_prefix = topic_prefix
+        self.topic = f"{topic_prefix}/messages"
         self.client_id = client_id
+
+        if topic_scheme not in TOPIC_SCHEMES:
+            raise ValueError(f"Unknown topic scheme: {topic_scheme}")
+        self.topic_scheme = topic_scheme
+        if subscriptions is None:
+            if topic_scheme == "per-call":
+                subscriptions = [self.call_topic_filter(), f"{topic_prefix}/events/+"]
+            else:
+                subscriptions = [self.topic]
+        # In a consumer group, each message goes to exactly one member of the group
+        if consumer_group:
+            if any(char in consumer_group for char in "/+#"):
+                raise ValueError(f"Invalid consumer group name: {consumer_group}")
+            subscriptions = [f"$share/{consumer_group}/{topic}" for topic in subscriptions]
+        self.consumer_group = consumer_group
+        self.subscriptions = subscriptions
+        # Receive Maximum: unacknowledged QoS 1 messages the broker may send us at once
+        self.max_inflight = max_inflight
+        self.codec = mqtt_codec.get_codec(codec)
+        self.publish_properties = Properties(PacketTypes.PUBLISH)
+        self.publish_properties.ContentType = self.codec.content_type
+        # Consumers that only use listeners can turn off queueing for get_messages()
+        self.queue_messages = queue_messages
         self.message_queue = Queue()
+        # Set whenever a message is queued, so pollers can skip empty checks
+        self.new_messages = threading.Event()
         self.connected = False
+        self.listeners = []
+
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+
+        # Async publish pipeline: publish() enqueues and a worker thread drains
+        self.async_publish = async_publish
+        self.publish_queue_size = publish_queue_size
+        self.overflow_policy = overflow_policy
+        self.publish_batch_size = publish_batch_size
+        self.block_timeout = block_timeout
+        self.publish_queue = deque()
+        self.publish_condition = threading.Condition()
+        self.publish_worker = None
+        self.stopping = False
+        self.published_count = 0
+        self.dropped_count = 0
+        self.coalesced_count = 0
+        self.publish_latency_total = 0.0
+        self.publish_latency_max = 0.0
         
         logger.info(f"Initializing MQTT Handler with client_id: {client_id}")
         
@@ -33,42 +94,85 @@ class MQTTHandler:
         self.client.on_disconnect = self.on_disconnect
         self.client.on_subscribe = self.on_subscribe
         
-        # Enable logging
-        self.client.enable_logger(logger)
+        # Paho logs every packet at DEBUG; give it its own logger so it can be tuned separately
+        self.client.enable_logger(logging.getLogger(f"{__name__}.paho"))
+
+    @classmethod
+    def from_env(cls, client_id, **kwargs):
+        """Create a handler using the topic and codec settings from the environment."""
+        load_dotenv()
+        kwargs.setdefault("topic_prefix", os.getenv("MQTT_TOPIC_PREFIX", "itest"))
+        kwargs.setdefault("topic_scheme", os.getenv("MQTT_TOPIC_SCHEME", "flat"))
+        kwargs.setdefault("codec", os.getenv("MQTT_CODEC", "json"))
+        if os.getenv("MQTT_MAX_INFLIGHT"):
+            kwargs.setdefault("max_inflight", int(os.getenv("MQTT_MAX_INFLIGHT")))
+        return cls(client_id=client_id, **kwargs)
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback for when the client connects to the broker."""
         if rc == 0:
             logger.info(f"MQTT Connected successfully. Client ID: {self.client_id}")
-            # Subscribe to topic
-            result = self.client.subscribe(self.topic, qos=1)
-            logger.info(f"Subscription attempt result: {result}")
+            # Subscribe to topics
+            if self.subscriptions:
+                result = self.client.subscribe([(topic, 1) for topic in self.subscriptions])
+                logger.info(f"Subscription attempt result: {result}")
             self.connected = True
+            # Let the publish worker drain anything queued while disconnected
+            with self.publish_condition:
+                self.publish_condition.notify_all()
         else:
             logger.error(f"Connection failed with code: {rc}")
             self.connected = False
 
     def on_message(self, client, userdata, message, properties=None):
         """Callback for when a message is received."""
+        with profiler.sampled("mqtt.on_message"):
+            self._on_message(message)
+
+    def _on_message(self, message):
         try:
-            data = json.loads(message.payload.decode())
+            content_type = getattr(message.properties, 'ContentType', None) if message.properties else None
+            data = mqtt_codec.decode(message.payload, content_type)
             if 'timestamp' not in data:
                 data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+            with call_context(data.get('CallSid')):
+                logger.info("MQTT Message Received on %s: %s", message.topic, LogPayload(data))
+
+                # Add to queue
+                if self.queue_messages:
+                    self.message_queue.put(data)
+                    self.new_messages.set()
+                    logger.debug("Message added to queue. Queue size: %d", self.message_queue.qsize())
+
+                for listener in self.listeners:
+                    listener(data)
                 
-            logger.info(f"MQTT Message Received on {message.topic}: {data}")
-            
-            # Add to queue
-            self.message_queue.put(data)
-            logger.debug(f"Message added to queue. Queue size: {self.message_queue.qsize()}")
-                
-        except json.JSONDecodeError:
-            logger.error(f"Failed to decode message payload: {message.payload}")
+        except ValueError:
+            logger.error("Failed to decode message payload: %.200r", message.payload)
         except Exception as e:
             logger.error(f"Error processing message: {e}")
 
+    def call_topic_filter(self, call_sid="+", msg_type="+"):
+        """Topic filter for per-call messages, e.g. one call or one message type."""
+        return f"{self.topic_prefix}/calls/{call_sid}/{msg_type}"
+
+    def topic_for(self, data):
+        """Topic a message is published to under the configured scheme."""
+        if self.topic_scheme == "flat":
+            return self.topic
+        msg_type = data.get('type', 'unknown')
+        if data.get('CallSid'):
+            return self.call_topic_filter(data['CallSid'], msg_type)
+        return f"{self.topic_prefix}/events/{msg_type}"
+
+    def add_listener(self, callback):
+        """Call callback(data) for every received message, on the MQTT network thread."""
+        self.listeners.append(callback)
+
     def on_subscribe(self, client, userdata, mid, reason_codes, properties=None):
         """Callback for when the client subscribes to a topic."""
-        logger.info(f"Subscribed to {self.topic} with mid: {mid}, reason_codes: {reason_codes}")
+        logger.info(f"Subscribed to {self.subscriptions} with mid: {mid}, reason_codes: {reason_codes}")
 
     def on_disconnect(self, client, userdata, rc, reasonCode, properties=None):
         """Callback for when the client disconnects from the broker."""
@@ -78,13 +182,26 @@ class MQTTHandler:
             logger.info("Disconnected successfully")
         self.connected = False
 
-    def connect(self):
-        """Connect to the MQTT broker."""
+    def connect(self, blocking=True):
+        """Connect to the MQTT broker.
+
+        With blocking=False the connection is made by the network loop, which
+        keeps retrying in the background if the broker is unreachable.
+        """
         try:
             logger.info(f"Attempting to connect to {self.broker}:{self.port}")
-            self.client.connect(self.broker, self.port, keepalive=60)
+            properties = None
+            if self.max_inflight:
+                properties = Properties(PacketTypes.CONNECT)
+                properties.ReceiveMaximum = self.max_inflight
+            if blocking:
+                self.client.connect(self.broker, self.port, keepalive=60, properties=properties)
+            else:
+                self.client.connect_async(self.broker, self.port, keepalive=60, properties=properties)
             self.client.loop_start()
             logger.info("MQTT loop started")
+            if self.async_publish:
+                self.start_publish_worker()
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             raise
@@ -92,54 +209,177 @@ class MQTTHandler:
     def disconnect(self):
         """Disconnect from the MQTT broker."""
         try:
+            self.stop_publish_worker()
             self.client.loop_stop()
             self.client.disconnect()
             logger.info("MQTT client disconnected")
         except Exception as e:
             logger.error(f"Error during disconnect: {e}")
 
-    def publish(self, data):
-        """Publish message to MQTT topic."""
+    def start_publish_worker(self):
+        """Start the background thread that drains the publish queue."""
+        if self.publish_worker and self.publish_worker.is_alive():
+            return
+        self.stopping = False
+        self.publish_worker = threading.Thread(
+            target=self._publish_loop,
+            name=f"mqtt-publish-{self.client_id}",
+            daemon=True
+        )
+        self.publish_worker.start()
+        logger.info("MQTT publish worker started")
+
+    def stop_publish_worker(self, timeout=5):
+        """Stop the publish worker, giving it a chance to flush the queue."""
+        if not self.publish_worker:
+            return
+        with self.publish_condition:
+            self.stopping = True
+            self.publish_condition.notify_all()
+        self.publish_worker.join(timeout)
+        self.publish_worker = None
+
+    def _enqueue(self, data, coalesce_key):
+        entry = (data, coalesce_key, time.monotonic())
+        with self.publish_condition:
+            if len(self.publish_queue) >= self.publish_queue_size:
+                if self.overflow_policy == "block":
+                    self.publish_condition.wait_for(
+                        lambda: len(self.publish_queue) < self.publish_queue_size,
+                        timeout=self.block_timeout
+                    )
+                if len(self.publish_queue) >= self.publish_queue_size:
+                    self.dropped_count += 1
+                    if self.overflow_policy == "drop_oldest":
+                        self.publish_queue.popleft()
+                    else:
+                        logger.warning("MQTT publish queue full, dropping message")
+                        return False
+            self.publish_queue.append(entry)
+            self.publish_condition.notify_all()
+        return True
+
+    def _next_batch(self):
+        """Wait for queued messages and take up to one batch, coalescing by key."""
+        with self.publish_condition:
+            self.publish_condition.wait_for(
+                lambda: self.stopping or (self.publish_queue and self.connected),
+                timeout=1.0
+            )
+            if not self.connected and not self.stopping:
+                return []
+            batch = []
+            while self.publish_queue and len(batch) < self.publish_batch_size:
+                batch.append(self.publish_queue.popleft())
+            # Wake any publishers blocked on a full queue
+            self.publish_condition.notify_all()
+
+        latest = {}
+        for index, (_, coalesce_key, _) in enumerate(batch):
+            if coalesce_key is not None:
+                latest[coalesce_key] = index
+        coalesced = [
+            entry for index, entry in enumerate(batch)
+            if entry[1] is None or latest[entry[1]] == index
+        ]
+        if len(coalesced) < len(batch):
+            with self.publish_condition:
+                self.coalesced_count += len(batch) - len(coalesced)
+        return coalesced
+
+    def _publish_loop(self):
+        while True:
+            batch = self._next_batch()
+            for data, _, enqueued_at in batch:
+                try:
+                    self._publish_now(data)
+                except Exception:
+                    # Already logged by _publish_now
+                    continue
+                latency = time.monotonic() - enqueued_at
+                with self.publish_condition:
+                    self.published_count += 1
+                    self.publish_latency_total += latency
+                    self.publish_latency_max = max(self.publish_latency_max, latency)
+            if self.stopping:
+                with self.publish_condition:
+                    if not self.publish_queue or not self.connected:
+                        break
+
+    def publish_stats(self):
+        """Return queue depth, drop counts and publish latency for the async pipeline."""
+        with self.publish_condition:
+            return {
+                "queue_depth": len(self.publish_queue),
+                "published": self.published_count,
+                "dropped": self.dropped_count,
+                "coalesced": self.coalesced_count,
+                "avg_latency": self.publish_latency_total / self.published_count if self.published_count else 0.0,
+                "max_latency": self.publish_latency_max,
+            }
+
+    def publish(self, data, coalesce_key=None):
+        """Publish message to MQTT topic.
+
+        In async mode the message is queued and published by the worker thread;
+        queued messages sharing a coalesce_key within a batch collapse to the latest.
+        """
+        if 'timestamp' not in data:
+            data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.async_publish:
+            return self._enqueue(data, coalesce_key)
+        return self._publish_now(data)
+
+    def _publish_now(self, data):
+        with profiler.sampled("mqtt.publish"):
+            return self._publish(data)
+
+    def _publish(self, data):
         try:
-            if 'timestamp' not in data:
-                data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-            message = json.dumps(data)
-            logger.info(f"Publishing message to {self.topic}: {message}")
+            topic = self.topic_for(data)
+            payload = mqtt_codec.encode(self.codec, data)
+            logger.info("Publishing message to %s: %s", topic, LogPayload(data))
+
             
             result = self.client.publish(
-                self.topic,
-                message,
-                qos=1
+                topic,
+                payload,
+                qos=1,
+                properties=self.publish_properties
             )
             
-            logger.info(f"Publish result: {result}")
+            logger.debug("Publish result: %s", result)
             return result
             
         except Exception as e:
             logger.error(f"Error publishing message: {e}")
             raise
 
-    def get_messages(self):
-        """Get all available messages from the queue."""
+    def get_messages(self, limit=None):
+        """Get available messages from the queue, at most limit of them if given."""
         messages = []
-        while not self.message_queue.empty():
+        self.new_messages.clear()
+        while not self.message_queue.empty() and (limit is None or len(messages) < limit):
             try:
                 msg = self.message_queue.get_nowait()
                 messages.append(msg)
-                logger.debug(f"Retrieved message from queue: {msg}")
+                logger.debug("Retrieved message from queue: %s", LogPayload(msg))
             except Exception as e:
                 logger.error(f"Error getting message from queue: {e}")
                 break
+        if not self.message_queue.empty():
+            self.new_messages.set()
         
         if messages:
-            logger.info(f"Retrieved {len(messages)} messages from queue")
+            logger.info("Retrieved %d messages from queue", len(messages))
         return messages
 
-    def update_streamlit_state(self):
+    def update_streamlit_state(self, limit=None):
         """Update Streamlit session state with new messages."""
+        # Imported here so non-Streamlit processes don't pay for it
+        import streamlit as st
         try:
-            new_messages = self.get_messages()
+            new_messages = self.get_messages(limit)
             if new_messages:
                 st.session_state.messages.extend(new_messages)
                 logger.info(f"Added {len(new_messages)} new messages to session state")
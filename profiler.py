@@ -0,0 +1,217 @@
+"""On-demand sampling profiler for the webhook and MQTT hot paths.
+
+Code paths opt in with `with profiler.sampled("name"):`. While profiling is
+off that is a single flag check. While it is on, a sample_rate fraction of
+calls register their thread, and a background thread snapshots the stacks
+of registered threads every `interval` seconds. Stopping writes the
+aggregated stacks to PROFILER_OUTPUT_DIR:
+
+    profile-<time>.collapsed   one "name;frame;frame count" line per stack,
+                               readable by flamegraph.pl and speedscope
+    profile-<time>-top.txt     functions ranked by self and total samples
+
+Profiling is started and stopped through the server's /admin/profile
+endpoint or by sending SIGUSR2 to the server process.
+"""
+import contextlib
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+_NULL = contextlib.nullcontext()
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class _Sampled:
+    """Registers the current thread with the profiler for the duration of a block."""
+
+    __slots__ = ("profiler", "name", "thread_id")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.thread_id = None
+
+    def __enter__(self):
+        thread_id = threading.get_ident()
+        with self.profiler.lock:
+            # A nested hook on the same thread is already covered by the outer one
+            if thread_id not in self.profiler.targets:
+                self.profiler.targets[thread_id] = (self.name, sys._getframe(1))
+                self.thread_id = thread_id
+                self.profiler.sampled_calls += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.thread_id is not None:
+            with self.profiler.lock:
+                self.profiler.targets.pop(self.thread_id, None)
+        return False
+
+class SamplingProfiler:
+    def __init__(self, sample_rate=0.1, interval=0.005, output_dir="profiles", top_n=30):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.targets = {}
+        self.stacks = Counter()
+        self.sampled_calls = 0
+        self.started_at = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.timer = None
+
+    def configure_from_env(self):
+        """Read the PROFILER_* settings; call once .env has been loaded."""
+        self.sample_rate = float(os.getenv("PROFILER_SAMPLE_RATE", self.sample_rate))
+        self.interval = float(os.getenv("PROFILER_INTERVAL_MS", self.interval * 1000)) / 1000
+        self.output_dir = os.getenv("PROFILER_OUTPUT_DIR", self.output_dir)
+        self.top_n = int(os.getenv("PROFILER_TOP_N", self.top_n))
+
+    def sampled(self, name):
+        """Context manager profiling the block for a sample of calls while profiling is on."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return _NULL
+        return _Sampled(self, name)
+
+    def start(self, sample_rate=None, duration=None):
+        """Start profiling; with a duration, stop and write the report automatically."""
+        with self.lock:
+            if self.enabled:
+                return False
+            if sample_rate is not None:
+                self.sample_rate = sample_rate
+            self.stacks = Counter()
+            self.sampled_calls = 0
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self.thread.start()
+            self.enabled = True
+        if duration:
+            self.timer = threading.Timer(duration, self.stop)
+            self.timer.daemon = True
+            self.timer.start()
+        logger.warning(f"Profiling started at sample rate {self.sample_rate}")
+        return True
+
+    def stop(self):
+        """Stop profiling and write the reports; returns their paths, or None if not running."""
+        with self.lock:
+            if not self.enabled:
+                return None
+            self.enabled = False
+            self.stop_event.set()
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.thread.join()
+        with self.lock:
+            self.targets.clear()
+        paths = self.write_reports()
+        logger.warning(f"Profiling stopped, reports written to {', '.join(paths)}")
+        return paths
+
+    def toggle(self):
+        if self.enabled:
+            return self.stop()
+        return self.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                targets = dict(self.targets)
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, (name, entry) in targets.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    if frame is entry:
+                        break
+                    frame = frame.f_back
+                # The block may have finished between copying targets and reading frames
+                if frame is None:
+                    continue
+                stack.append(name)
+                samples.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(samples)
+
+    def top(self):
+        """Functions with the most samples at the top of the stack (self) and anywhere in it (total)."""
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            self_counts[frames[-1]] += count
+            for frame in set(frames):
+                total_counts[frame] += count
+        return self_counts.most_common(self.top_n), total_counts.most_common(self.top_n)
+
+    def write_reports(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        prefix = os.path.join(self.output_dir, f"profile-{stamp}")
+        with self.lock:
+            stacks = Counter(self.stacks)
+            sampled_calls = self.sampled_calls
+        total = sum(stacks.values())
+
+        collapsed_path = f"{prefix}.collapsed"
+        with open(collapsed_path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        top_path = f"{prefix}-top.txt"
+        by_self, by_total = self.top()
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        with open(top_path, "w") as f:
+            f.write(f"{total} samples from {sampled_calls} sampled calls over {elapsed:.1f}s "
+                    f"(sample rate {self.sample_rate}, interval {self.interval * 1000:g}ms)\n")
+            for title, rows in (("Self", by_self), ("Total", by_total)):
+                f.write(f"\n{title} samples:\n")
+                for label, count in rows:
+                    f.write(f"{count:8d} {count / total:7.1%}  {label}\n")
+        return [collapsed_path, top_path]
+
+    def status(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "sampled_calls": self.sampled_calls,
+                "samples": sum(self.stacks.values()),
+            }
+
+    def install_signal_handler(self, signum=getattr(signal, "SIGUSR2", None)):
+        """Toggle profiling when the process receives signum (main thread only)."""
+        if signum is None:
+            return False
+        try:
+            # Writing reports from inside a signal handler could deadlock on the lock
+            signal.signal(signum, lambda *_: threading.Thread(target=self.toggle, name="profiler-toggle").start())
+        except ValueError:
+            logger.info("Not on the main thread, profiler signal handler not installed")
+            return False
+        return True
+
+# Settings are read by configure_from_env(), after the server loads .env
+profiler = SamplingProfiler()
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILLER_WORDS = frozenset({
+    "um", "umm", "uh", "uhh", "uhm", "er", "erm", "ah", "hmm", "mm", "please"
+})
+
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+class ResponseCache:
+    """LRU cache of LLM responses keyed by normalized caller input.
+
+    Keys can optionally be scoped to the system prompt and to the last
+    history_turns exchanges of the conversation. The default of one
+    exchange keeps context-dependent replies ("yes", "what about tomorrow")
+    from being served to other calls. With history_turns=0 a response is
+    reused for the same utterance regardless of the call.
+    """
+
+    def __init__(self, max_entries=500, ttl=3600, history_turns=1,
+                 scope_system_prompt=True, filler_words=DEFAULT_FILLER_WORDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.history_turns = history_turns
+        self.scope_system_prompt = scope_system_prompt
+        self.filler_words = frozenset(filler_words)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def normalize(self, text):
+        """Lowercase, strip punctuation and drop filler words."""
+        words = PUNCTUATION.sub(" ", text.lower()).split()
+        return " ".join(word for word in words if word not in self.filler_words)
+
+    def make_key(self, text, system_prompt="", chat_history=()):
+        """Build a cache key for an utterance within its configured scope."""
+        parts = [self.normalize(text)]
+        if self.scope_system_prompt:
+            parts.append(system_prompt)
+        if self.history_turns > 0:
+            for role, content in list(chat_history)[-2 * self.history_turns:]:
+                parts.append(f"{role}:{self.normalize(content)}")
+        return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        response, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def contains(self, key):
+        """Check for a live entry without touching the hit/miss counters."""
+        if not self.enabled:
+            return False
+        with self.lock:
+            return self._lookup(key) is not None
+
+    def get(self, key):
+        """Return the cached response for key, or None."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            response = self._lookup(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return response
+
+    def put(self, key, response):
+        """Store a response, evicting the least recently used entries."""
+        if not self.enabled or not response:
+            return
+        with self.lock:
+            self.entries[key] = (response, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Return size and hit/miss counters."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,121 @@
+import re
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# A sentence ends with terminal punctuation followed by whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+class StreamingResponse:
+    """Buffer of completed sentences for one in-progress LLM generation."""
+
+    def __init__(self, call_sid):
+        self.call_sid = call_sid
+        self.sentences = deque()
+        self.condition = threading.Condition()
+        self.finished = False
+        self.text = ""
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def add_sentence(self, sentence):
+        with self.condition:
+            self.sentences.append(sentence)
+            self.condition.notify_all()
+
+    def finish(self, text):
+        with self.condition:
+            self.text = text
+            self.finished = True
+            self.condition.notify_all()
+
+    def next_sentences(self, timeout=None):
+        """Wait for buffered sentences and return (sentences, finished).
+
+        Returns as soon as at least one sentence is available or the
+        generation has finished, or an empty list once the timeout expires.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.sentences or self.finished, timeout=timeout)
+            sentences = list(self.sentences)
+            self.sentences.clear()
+            return sentences, self.finished
+
+class ResponseStreamer:
+    """Runs streaming generations in the background, one per CallSid."""
+
+    def __init__(self):
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def start(self, call_sid, chunks, on_complete=None):
+        """Consume the chunk iterator returned by chunks() in a worker thread.
+
+        on_complete(text, completed) gets the generated text; completed is
+        False if the generation failed partway and the text is truncated. A
+        discarded stream stops generating and doesn't call on_complete.
+        """
+        stream = StreamingResponse(call_sid)
+        with self.lock:
+            self.streams[call_sid] = stream
+        worker = threading.Thread(
+            target=self._run,
+            args=(stream, chunks, on_complete),
+            name=f"stream-{call_sid}",
+            daemon=True
+        )
+        worker.start()
+        return stream
+
+    def get(self, call_sid):
+        with self.lock:
+            return self.streams.get(call_sid)
+
+    def discard(self, call_sid, cancel=False):
+        """Forget a call's stream; with cancel, also stop its generation (e.g. on hangup)."""
+        with self.lock:
+            stream = self.streams.pop(call_sid, None)
+        if stream is not None and cancel:
+            stream.cancel()
+
+    def _run(self, stream, chunks, on_complete):
+        pending = ""
+        parts = []
+        completed = False
+        iterator = chunks()
+        try:
+            for chunk in iterator:
+                if stream.cancelled.is_set():
+                    break
+                parts.append(chunk)
+                pending += chunk
+                pieces = SENTENCE_END.split(pending)
+                # The last piece may still be an incomplete sentence
+                for sentence in pieces[:-1]:
+                    if sentence.strip():
+                        stream.add_sentence(sentence.strip())
+                pending = pieces[-1]
+            if pending.strip():
+                stream.add_sentence(pending.strip())
+            completed = not stream.cancelled.is_set()
+        except Exception as e:
+            logger.error(f"Streaming generation failed for call {stream.call_sid}: {e}")
+            stream.add_sentence("Sorry, something went wrong. Let's try again.")
+        finally:
+            # Closing the iterator ends the request, which stops Ollama generating
+            if hasattr(iterator, "close"):
+                iterator.close()
+        text = "".join(parts).strip()
+        stream.finish(text)
+        if stream.cancelled.is_set():
+            logger.info(f"Stopped streaming generation for ended call {stream.call_sid}")
+            return
+        if on_complete and text:
+            try:
+                on_complete(text, completed)
+            except Exception as e:
+                logger.error(f"Error completing streamed response for call {stream.call_sid}: {e}")
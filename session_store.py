@@ -0,0 +1,193 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CallSession:
+    def __init__(self, call_sid):
+        self.call_sid = call_sid
+        self.turns = deque()
+        self.token_count = 0
+        self.last_access = time.monotonic()
+        # Running summary of turns that were folded out of the verbatim history
+        self.summary = ""
+        # Position of turns[0] among all turns of the call
+        self.first_index = 0
+        self.summarizing = False
+
+    def history(self):
+        """Flatten stored turns into chat_history messages for the prompt."""
+        messages = []
+        if self.summary:
+            messages.append(("system", f"Summary of the earlier conversation: {self.summary}"))
+        for user_text, agent_text in self.turns:
+            messages.append(("human", user_text))
+            messages.append(("ai", agent_text))
+        return messages
+
+class SessionStore:
+    """Per-call conversation history keyed by Twilio CallSid.
+
+    Sessions are kept in least-recently-used order so that both the LRU cap
+    and the idle TTL can be enforced by popping from the front.
+
+    If summarize(summary, turns) is given, older turns are folded into a
+    running summary on a background thread once a call's history passes
+    summary_threshold tokens (or max_turns turns), keeping the last
+    keep_turns exchanges verbatim. summarize may return None to skip a
+    summary for now (e.g. no LLM capacity); it is tried again on the next
+    turn. max_turns and max_tokens stay as hard caps in case summarization
+    falls behind.
+    """
+
+    def __init__(self, max_sessions=1000, idle_ttl=900, max_turns=10, max_tokens=2000,
+                 summarize=None, summary_threshold=1000, keep_turns=4, summary_workers=2):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.summary_threshold = summary_threshold
+        self.keep_turns = keep_turns
+        self.summary_workers = summary_workers
+        self.executor = None
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Rough token estimate (about four characters per token)."""
+        return len(text) // 4 + 1
+
+    def _purge_expired(self, now):
+        while self.sessions:
+            call_sid, session = next(iter(self.sessions.items()))
+            if now - session.last_access < self.idle_ttl:
+                break
+            self.sessions.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"Evicted idle session {call_sid}")
+
+    def _touch(self, call_sid, create=False):
+        now = time.monotonic()
+        self._purge_expired(now)
+        session = self.sessions.get(call_sid)
+        if session is None:
+            if not create:
+                return None
+            session = CallSession(call_sid)
+            self.sessions[call_sid] = session
+            while len(self.sessions) > self.max_sessions:
+                evicted_sid, _ = self.sessions.popitem(last=False)
+                self.evictions += 1
+                logger.debug(f"Evicted least recently used session {evicted_sid}")
+        else:
+            self.sessions.move_to_end(call_sid)
+        session.last_access = now
+        return session
+
+    def get_history(self, call_sid):
+        """Return the chat history for a call, or an empty list if unknown."""
+        if not call_sid:
+            return []
+        with self.lock:
+            session = self._touch(call_sid)
+            return session.history() if session else []
+
+    def last_response(self, call_sid):
+        """Return the agent's most recent answer on a call, or None."""
+        if not call_sid:
+            return None
+        with self.lock:
+            session = self._touch(call_sid)
+            return session.turns[-1][1] if session and session.turns else None
+
+    def append_turn(self, call_sid, user_text, agent_text, create=True):
+        """Record a completed exchange and trim the session to its caps.
+
+        With create=False the turn is dropped if the session is gone, e.g.
+        because the call ended while the answer was being generated.
+        """
+        if not call_sid:
+            return
+        with self.lock:
+            session = self._touch(call_sid, create=create)
+            if session is None:
+                return
+            session.turns.append((user_text, agent_text))
+            session.token_count += self.estimate_tokens(user_text) + self.estimate_tokens(agent_text)
+            job = self._summary_job(session)
+            while session.turns and (
+                len(session.turns) > self.max_turns or session.token_count > self.max_tokens
+            ):
+                old_user, old_agent = session.turns.popleft()
+                session.token_count -= self.estimate_tokens(old_user) + self.estimate_tokens(old_agent)
+                session.first_index += 1
+            if job is not None and self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.summary_workers, thread_name_prefix="summarize"
+                )
+        if job is not None:
+            self.executor.submit(self._summarize, session, *job)
+
+    def _summary_job(self, session):
+        """Pick the turns to fold into the summary, if the session is due for one."""
+        if self.summarize is None or session.summarizing or len(session.turns) <= self.keep_turns:
+            return None
+        if session.token_count <= self.summary_threshold and len(session.turns) < self.max_turns:
+            return None
+        turns = list(session.turns)[:len(session.turns) - self.keep_turns]
+        session.summarizing = True
+        return session.summary, turns, session.first_index + len(turns)
+
+    def _summarize(self, session, summary, turns, end_index):
+        failed = False
+        try:
+            summary = self.summarize(summary, turns)
+            summary = summary.strip() if summary is not None else None
+        except Exception as e:
+            logger.warning(f"Summarizing history for call {session.call_sid} failed: {e}")
+            summary = None
+            failed = True
+        with self.lock:
+            session.summarizing = False
+            if summary is None:
+                if failed:
+                    self.summary_failures += 1
+                else:
+                    logger.debug(f"Deferred summarizing history for call {session.call_sid}")
+                return
+            # The call may have ended while the summary was being written
+            if self.sessions.get(session.call_sid) is not session:
+                return
+            while session.turns and session.first_index < end_index:
+                old_user, old_agent = session.turns.popleft()
+                session.token_count -= self.estimate_tokens(old_user) + self.estimate_tokens(old_agent)
+                session.first_index += 1
+            session.summary = summary
+            self.summaries += 1
+        logger.debug(f"Folded {len(turns)} turns into the summary for call {session.call_sid}")
+
+    def end_session(self, call_sid):
+        """Drop a call's history once the call is over."""
+        with self.lock:
+            session = self.sessions.pop(call_sid, None)
+        if session:
+            logger.info(f"Cleared session for call {call_sid}")
+        return session is not None
+
+    def stats(self):
+        """Return current size and eviction counters."""
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "evictions": self.evictions,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+            }
@@ -0,0 +1,117 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Speculation:
+    """One background generation started from a partial transcript."""
+
+    def __init__(self, call_sid, text, key):
+        self.call_sid = call_sid
+        self.text = text
+        self.key = key
+        self.result = None
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+class SpeculativeGenerator:
+    """Starts LLM generations from stable partial speech, keyed by CallSid.
+
+    generate(text, chat_history, cancelled) must return the response text, or
+    None if it noticed the cancelled event and stopped early. normalize() maps a
+    transcript to the form used to match the partial against the final result.
+    """
+
+    def __init__(self, generate, normalize, min_words=3):
+        self.generate = generate
+        self.normalize = normalize
+        self.min_words = min_words
+        self.speculations = {}
+        self.lock = threading.Lock()
+        self.started = 0
+        self.cancelled = 0
+        self.hits = 0
+        self.misses = 0
+
+    def on_partial(self, call_sid, stable_text, chat_history):
+        """Start (or restart) speculation when the stable transcript changes."""
+        key = self.normalize(stable_text or "")
+        if not call_sid or len(key.split()) < self.min_words:
+            return None
+        with self.lock:
+            current = self.speculations.get(call_sid)
+            if current is not None and current.key == key:
+                return current
+            if current is not None:
+                current.cancel()
+                self.cancelled += 1
+            speculation = Speculation(call_sid, stable_text, key)
+            self.speculations[call_sid] = speculation
+            self.started += 1
+        threading.Thread(
+            target=self._run,
+            args=(speculation, chat_history),
+            name=f"speculate-{call_sid}",
+            daemon=True
+        ).start()
+        return speculation
+
+    def _run(self, speculation, chat_history):
+        try:
+            speculation.result = self.generate(speculation.text, chat_history, speculation.cancelled)
+        except Exception as e:
+            logger.warning(f"Speculative generation failed for call {speculation.call_sid}: {e}")
+        finally:
+            speculation.done.set()
+
+    def matches(self, call_sid, final_text):
+        """Whether a live speculation was started from this exact utterance."""
+        with self.lock:
+            speculation = self.speculations.get(call_sid)
+        return speculation is not None and speculation.key == self.normalize(final_text)
+
+    def take(self, call_sid, final_text, timeout=None):
+        """Claim the speculative answer for the final transcript.
+
+        Returns the response on a hit. A speculation started from different
+        words is cancelled and None is returned, so the caller generates normally.
+        """
+        with self.lock:
+            speculation = self.speculations.pop(call_sid, None)
+        if speculation is None:
+            return None
+        if speculation.key != self.normalize(final_text):
+            speculation.cancel()
+            with self.lock:
+                self.misses += 1
+                self.cancelled += 1
+            return None
+        speculation.done.wait(timeout)
+        with self.lock:
+            if speculation.result is None:
+                speculation.cancel()
+                self.misses += 1
+                return None
+            self.hits += 1
+        return speculation.result
+
+    def discard(self, call_sid):
+        with self.lock:
+            speculation = self.speculations.pop(call_sid, None)
+        if speculation is not None:
+            speculation.cancel()
+
+    def stats(self):
+        with self.lock:
+            resolved = self.hits + self.misses
+            return {
+                "active": len(self.speculations),
+                "started": self.started,
+                "cancelled": self.cancelled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / resolved if resolved else 0.0,
+            }
@@ -1,6 +1,7 @@
 from twilio.rest import Client
 from twilio.http.http_client import TwilioHttpClient
 from twilio.twiml.voice_response import VoiceResponse
+from requests.adapters import HTTPAdapter
 import os
 import logging
 from dotenv import load_dotenv
@@ -8,7 +9,7 @@ from dotenv import load_dotenv
 logger = logging.getLogger(__name__)
 
 class TwilioHandler:
-    def __init__(self):
+    def __init__(self, pool_size=None):
         load_dotenv()
         
         # Twilio Configuration
@@ -17,9 +18,14 @@ class TwilioHandler:
         self.phone_number = os.getenv('TWILIO_PHONE_NUMBER')
         self.voice = os.getenv("APP_VOICE")
         self.ngrok_url = os.getenv('NGROK_URL')
+        # Ask Twilio for partial transcripts so the server can start answering early
+        self.partial_results = os.getenv('SPECULATIVE_GENERATION', 'false').lower() == 'true'
         
         # Initialize HTTP client with timeout
         self.http_client = TwilioHttpClient(timeout=120)
+        if pool_size:
+            # Allow one pooled connection per concurrent caller thread
+            self.http_client.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
         
         # Initialize Twilio client
         self.client = Client(
@@ -35,16 +41,46 @@ class TwilioHandler:
     def create_voice_response(self, message="Hello! How can I help you today?"):
         """Create a TwiML voice response."""
         response = VoiceResponse()
-        response.say(message, voice=self.voice)
+        if message:
+            response.say(message, voice=self.voice)
+        gather_options = {}
+        if self.partial_results:
+            gather_options['partialResultCallback'] = f"{self.ngrok_url}/partial-speech"
+            gather_options['partialResultCallbackMethod'] = 'POST'
         response.gather(
             input='speech dtmf',
             action=f"{self.ngrok_url}/process-input",
             method='POST',
             timeout=5,
-            speechTimeout='auto'
+            speechTimeout='auto',
+            **gather_options
         )
         return response
 
+    def create_streaming_response(self, message, continue_path="/continue-response"):
+        """Create a TwiML response that speaks part of an answer and fetches the rest."""
+        response = VoiceResponse()
+        if message:
+            response.say(message, voice=self.voice)
+        response.redirect(f"{self.ngrok_url}{continue_path}", method='POST')
+        return response
+
+    def create_hangup_response(self, message=None):
+        """Create a TwiML response that says goodbye and ends the call."""
+        response = VoiceResponse()
+        if message:
+            response.say(message, voice=self.voice)
+        response.hangup()
+        return response
+
+    def create_transfer_response(self, number, message=None):
+        """Create a TwiML response that forwards the caller to another number."""
+        response = VoiceResponse()
+        if message:
+            response.say(message, voice=self.voice)
+        response.dial(number)
+        return response
+
     def make_call(self, to_number):
         """Initiate a call to the specified number."""
         if not self.validate_phone_number(to_number):
@@ -62,6 +98,11 @@ class TwilioHandler:
         
         return call
     
+    def find_calls(self, to_number, since):
+        """Calls from this number to to_number created at or after since (an aware datetime)."""
+        calls = self.client.calls.list(to=to_number, from_=self.phone_number, limit=20)
+        return [call for call in calls if call.date_created and call.date_created >= since]
+
     def disconnect_call(self, call_sid):
         """Disconnect an established call."""
         return self.client.calls(call_sid).update(status="completed")
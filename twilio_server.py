@@ -1,139 +1,803 @@
 from flask import Flask, request, jsonify
 import logging
 from datetime import datetime
-import json
-from mqtt_handler import MQTTHandler
-from twilio_handler import TwilioHandler
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.output_parsers import StrOutputParser
+import os
+import threading
+import hmac
+from session_store import SessionStore
+from response_stream import ResponseStreamer
+from response_cache import ResponseCache
+from lazy_component import LazyComponent, StartupReport
+from model_keeper import ModelKeeper
+from speculation import SpeculativeGenerator
+from intent_router import IntentRouter
+from admission import AdmissionController, Overloaded
+from model_router import ModelRouter
+from profiler import profiler
+import metrics
+import time
 from operator import itemgetter
+from urllib.parse import urlencode
+from dotenv import load_dotenv
+from log_config import setup_logging, call_context
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Flask application
-app = Flask(__name__)
+startup_report = StartupReport()
 
-# Initialize handlers
-mqtt_handler = MQTTHandler(client_id="flask-mqtt-client")
-twilio_handler = TwilioHandler()
+with startup_report.phase("config"):
+    load_dotenv()
+    # Configure logging
+    setup_logging()
+    profiler.configure_from_env()
 
-# Initialize LLM and conversation chain
-try:
-    llm = OllamaLLM(model="llama3.2-vision")
+SYSTEM_PROMPT = "You are a helpful AI assistant handling phone calls. Keep responses clear, concise, and natural."
+
+# Heavy dependencies are imported and built on first use, so importing this
+# module stays cheap and an unreachable broker or Ollama can't stall startup.
+def create_mqtt_handler():
+    from mqtt_handler import MQTTHandler
+    handler = MQTTHandler.from_env(
+        "flask-mqtt-client",
+        async_publish=os.getenv("MQTT_ASYNC_PUBLISH", "true").lower() == "true",
+        publish_queue_size=int(os.getenv("MQTT_PUBLISH_QUEUE_SIZE", 1000)),
+        overflow_policy=os.getenv("MQTT_OVERFLOW_POLICY", "drop_oldest"),
+        # The server only publishes; nothing would drain received messages
+        subscriptions=[]
+    )
+    handler.connect(blocking=False)
+    return handler
+
+def create_twilio_handler():
+    from twilio_handler import TwilioHandler
+    return TwilioHandler()
+
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2-vision")
+# Optional small text model for simple turns; OLLAMA_MODEL answers the rest
+OLLAMA_SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL") or None
+MODELS = [OLLAMA_MODEL] + ([OLLAMA_SMALL_MODEL] if OLLAMA_SMALL_MODEL else [])
+
+def model_options():
+    """Ollama model options shared by generations and keep-alive pings."""
+    options = {}
+    if os.getenv("OLLAMA_NUM_CTX"):
+        options["num_ctx"] = int(os.getenv("OLLAMA_NUM_CTX"))
+    return options
+
+def create_model_keeper(model):
+    return ModelKeeper(
+        model,
+        keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+        interval=float(os.getenv("OLLAMA_KEEP_ALIVE_INTERVAL", 240)),
+        base_url=os.getenv("OLLAMA_HOST"),
+        options=model_options()
+    )
+
+# Keep each model resident in Ollama between calls
+model_keepers = {model: create_model_keeper(model) for model in MODELS}
+model_keeper = model_keepers[OLLAMA_MODEL]
+
+def ollama_options(model=OLLAMA_MODEL):
+    # Every request uses the same options (num_ctx in particular) so Ollama
+    # keeps the loaded model and its cached system-prompt prefix
+    llm_options = {"model": model, "keep_alive": model_keeper.keep_alive, **model_options()}
+    if os.getenv("OLLAMA_HOST"):
+        llm_options["base_url"] = os.getenv("OLLAMA_HOST")
+    return llm_options
+
+def create_conversation_chain(model=OLLAMA_MODEL):
+    from langchain_ollama import OllamaLLM
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import ConfigurableField
+
+    keeper = model_keepers[model]
+    llm = OllamaLLM(**ollama_options(model))
     prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a helpful AI assistant handling phone calls. Keep responses clear, concise, and natural."),
+        ("system", SYSTEM_PROMPT),
         MessagesPlaceholder(variable_name="chat_history"),
         ("human", "{input}")
     ])
-    
-    def create_chain():
-        return (
-            {
-                "input": itemgetter("input"),
-                "chat_history": itemgetter("chat_history")
-            }
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-    
-    conversation_chain = create_chain()
-except Exception as e:
-    logger.error(f"Failed to initialize LLM: {e}")
-    conversation_chain = None
 
-# Store chat history
-chat_history = []
+    if os.getenv("OLLAMA_WARM_UP", "true").lower() == "true":
+        try:
+            with startup_report.phase("model_warm_up" if model == OLLAMA_MODEL else f"model_warm_up:{model}"):
+                keeper.warm_up(
+                    prompt | llm.model_copy(update={"num_predict": 1}),
+                    {"input": "Hello", "chat_history": []}
+                )
+        except Exception as e:
+            logger.warning(f"Warm-up of {model} failed, first turn will load the model: {e}")
+    keeper.start()
+
+    return (
+        {
+            "input": itemgetter("input"),
+            "chat_history": itemgetter("chat_history")
+        }
+        | prompt
+        # Lets overloaded turns ask for a shorter answer (see generation_config)
+        | llm.configurable_fields(num_predict=ConfigurableField(id="num_predict"))
+        | StrOutputParser()
+    )
+
+SUMMARY_PROMPT = (
+    "Summarize this phone call between a caller and an AI assistant in a few sentences. "
+    "Keep names, numbers, requests and anything the assistant promised.\n\n"
+    "Summary so far:\n{summary}\n\n"
+    "New exchanges:\n{transcript}\n\n"
+    "Updated summary:"
+)
+
+def create_summary_chain():
+    from langchain_ollama import OllamaLLM
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+
+    # Summaries don't need the large model when a small one is configured
+    llm = OllamaLLM(
+        **ollama_options(OLLAMA_SMALL_MODEL or OLLAMA_MODEL),
+        num_predict=int(os.getenv("SESSION_SUMMARY_MAX_TOKENS", 200))
+    )
+    return PromptTemplate.from_template(SUMMARY_PROMPT) | llm | StrOutputParser()
+
+mqtt_component = LazyComponent("mqtt", create_mqtt_handler, startup_report)
+twilio_component = LazyComponent("twilio", create_twilio_handler, startup_report)
+chain_component = LazyComponent("llm_chain", create_conversation_chain, startup_report)
+chain_components = {OLLAMA_MODEL: chain_component}
+if OLLAMA_SMALL_MODEL:
+    chain_components[OLLAMA_SMALL_MODEL] = LazyComponent(
+        "small_llm_chain", lambda: create_conversation_chain(OLLAMA_SMALL_MODEL), startup_report
+    )
+summary_component = LazyComponent("summary_chain", create_summary_chain, startup_report)
+
+def get_mqtt_handler():
+    return mqtt_component.get()
+
+def get_twilio_handler():
+    return twilio_component.get()
+
+def get_conversation_chain(model=OLLAMA_MODEL):
+    return chain_components[model].get()
+
+def publish(data, coalesce_key=None):
+    """Publish to MQTT, skipping the message while MQTT is unavailable."""
+    mqtt_handler = get_mqtt_handler()
+    if mqtt_handler is None:
+        logger.warning(f"MQTT unavailable, not publishing {data.get('type')} message")
+        return
+    mqtt_handler.publish(data, coalesce_key=coalesce_key)
+
+def warm_up():
+    """Initialize every component now instead of on the first request."""
+    for component in (twilio_component, mqtt_component, *chain_components.values()):
+        component.get()
+    logger.info(f"Startup report: {startup_report.summary()}")
+
+def warm_up_in_background():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+def summarize_history(summary, turns):
+    """Fold older exchanges of a call into its running summary.
+
+    Returns None without generating when the model has no free slot; the
+    session store tries again on the call's next turn.
+    """
+    summary_chain = summary_component.get()
+    if summary_chain is None:
+        raise RuntimeError("summary chain unavailable")
+    model = OLLAMA_SMALL_MODEL or OLLAMA_MODEL
+    # Summaries are background work: they only use spare capacity, like speculation
+    pool = admission_pools[model]
+    if not pool.try_acquire():
+        return None
+    try:
+        transcript = "\n".join(f"Caller: {user_text}\nAssistant: {agent_text}" for user_text, agent_text in turns)
+        model_keepers[model].touch()
+        return summary_chain.invoke({"summary": summary or "(none)", "transcript": transcript})
+    finally:
+        pool.release()
+
+# Store chat history per call, keyed by CallSid
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", 1000)),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", 900)),
+    max_turns=int(os.getenv("SESSION_MAX_TURNS", 10)),
+    max_tokens=int(os.getenv("SESSION_MAX_TOKENS", 2000)),
+    # Summarize older turns instead of dropping them on long calls
+    summarize=summarize_history if os.getenv("SESSION_SUMMARIZE", "false").lower() == "true" else None,
+    summary_threshold=int(os.getenv("SESSION_SUMMARY_THRESHOLD", 1000)),
+    keep_turns=int(os.getenv("SESSION_SUMMARY_KEEP_TURNS", 4))
+)
+
+# Stream LLM output sentence by sentence instead of waiting for the full answer
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "false").lower() == "true"
+STREAM_WAIT_TIMEOUT = float(os.getenv("STREAM_WAIT_TIMEOUT", 8))
+response_streamer = ResponseStreamer()
+
+# Reuse answers for repeated utterances; disabled when RESPONSE_CACHE_SIZE is 0
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", 0)),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", 3600)),
+    history_turns=int(os.getenv("RESPONSE_CACHE_HISTORY_TURNS", 1)),
+    scope_system_prompt=os.getenv("RESPONSE_CACHE_SCOPE_PROMPT", "true").lower() == "true"
+)
+
+def generate_speculatively(text, chat_history, cancelled):
+    """Stream a response for a partial transcript, stopping early if cancelled."""
+    model = choose_model(text, chat_history, count=False)
+    conversation_chain = get_conversation_chain(model)
+    if conversation_chain is None:
+        return None
+    # Speculation only uses spare capacity: it never queues behind real turns
+    pool = admission_pools[model]
+    if not pool.try_acquire():
+        return None
+    if speculation_slots is not None and not speculation_slots.acquire(blocking=False):
+        pool.release()
+        return None
+    try:
+        model_keepers[model].touch()
+        parts = []
+        # Leaving the stream early closes the request, which stops Ollama generating
+        for chunk in conversation_chain.stream({"input": text, "chat_history": chat_history}):
+            if cancelled.is_set():
+                return None
+            parts.append(chunk)
+        return "".join(parts)
+    finally:
+        pool.release()
+        if speculation_slots is not None:
+            speculation_slots.release()
+
+# Start generating from Twilio's partial transcripts before the caller finishes
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() == "true"
+SPECULATION_WAIT_TIMEOUT = float(os.getenv("SPECULATION_WAIT_TIMEOUT", 10))
+# Cap on concurrent speculative generations, also when LLM_MAX_CONCURRENT is unlimited
+SPECULATION_MAX_CONCURRENT = int(os.getenv("SPECULATION_MAX_CONCURRENT", 4))
+speculation_slots = threading.BoundedSemaphore(SPECULATION_MAX_CONCURRENT) if SPECULATION_MAX_CONCURRENT else None
+speculator = SpeculativeGenerator(
+    generate_speculatively,
+    response_cache.normalize,
+    min_words=int(os.getenv("SPECULATION_MIN_WORDS", 3))
+)
+
+def load_intent_router():
+    """Load the zero-LLM intent config, falling back to a router that matches nothing."""
+    path = os.getenv("INTENTS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json"))
+    if not os.path.exists(path):
+        logger.info(f"No intent config at {path}, every turn goes to the LLM")
+        return IntentRouter(normalize=response_cache.normalize)
+    try:
+        return IntentRouter.from_file(path, response_cache.normalize)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Invalid intent config {path}, every turn goes to the LLM: {e}")
+        return IntentRouter(normalize=response_cache.normalize)
+
+# Answer greetings, repeats, goodbyes and menu digits without calling the LLM
+intent_router = load_intent_router()
+
+# Admission control: bound concurrent LLM turns and answer within Twilio's
+# 15 second webhook timeout, shortening or deferring answers under load
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE", 12))
+DEGRADED_NUM_PREDICT = int(os.getenv("DEGRADED_NUM_PREDICT", 48))
+ADMISSION_MAX_RETRIES = int(os.getenv("ADMISSION_MAX_RETRIES", 2))
+HOLD_MESSAGE = "One moment please."
+BUSY_MESSAGE = "Sorry, we're very busy right now. Could you say that again in a moment?"
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", 0)),
+    probe_interval=float(os.getenv("ADMISSION_PROBE_INTERVAL", 30))
+)
+# Each model has its own concurrency pool and latency estimates
+admission_pools = {OLLAMA_MODEL: admission}
+if OLLAMA_SMALL_MODEL:
+    admission_pools[OLLAMA_SMALL_MODEL] = AdmissionController(
+        max_concurrent=int(os.getenv("OLLAMA_SMALL_MAX_CONCURRENT", 0)),
+        probe_interval=float(os.getenv("ADMISSION_PROBE_INTERVAL", 30))
+    )
+
+# Send short, simple turns to OLLAMA_SMALL_MODEL when one is configured
+model_router = ModelRouter(
+    OLLAMA_SMALL_MODEL,
+    OLLAMA_MODEL,
+    max_words=int(os.getenv("MODEL_ROUTER_MAX_WORDS", 20)),
+    max_history_turns=int(os.getenv("MODEL_ROUTER_MAX_HISTORY_TURNS", 6))
+)
+
+def choose_model(text, chat_history, count=True):
+    """Pick the model for a turn, using OLLAMA_MODEL if the small model is unavailable.
+
+    Speculative runs pass count=False; their route is counted when the answer is used.
+    """
+    model, reason = model_router.choose(text, chat_history)
+    if model != OLLAMA_MODEL and get_conversation_chain(model) is None:
+        model, reason = OLLAMA_MODEL, "fallback"
+    if count:
+        MODEL_ROUTES.inc(model=model, reason=reason)
+    return model
 
-def get_response(speech_result, digits):
-    """Get appropriate response based on input."""
+def generation_config(mode):
+    """Chain config for an admitted generation; degraded turns get a shorter answer."""
+    if mode == "degraded":
+        return {"configurable": {"num_predict": DEGRADED_NUM_PREDICT}}
+    return None
+
+# Prometheus metrics served on /metrics
+registry = metrics.Registry()
+STAGE_LATENCY = registry.histogram(
+    "chatr_turn_stage_seconds", "Time spent in each stage of a /process-input turn", ["stage"]
+)
+TURN_LATENCY = registry.histogram("chatr_turn_seconds", "Total time to answer a /process-input turn")
+LLM_TOKENS = registry.counter("chatr_llm_tokens_total", "Approximate tokens generated by the LLM", ["model"])
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "chatr_llm_tokens_per_second", "Approximate LLM generation rate per turn", ["model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+)
+LLM_LATENCY = registry.histogram("chatr_llm_generation_seconds", "Time to generate a full answer", ["model"])
+MODEL_ROUTES = registry.counter("chatr_model_routes_total", "Turns routed to each model", ["model", "reason"])
+ERRORS = registry.counter("chatr_errors_total", "Requests that failed with an error", ["route"])
+IN_FLIGHT = registry.gauge("chatr_in_flight_requests", "Requests currently being handled", ["route"])
+
+def admission_stat(name):
+    """Metric callback reporting one admission statistic per model."""
+    return lambda: {(model,): pool.stats()[name] for model, pool in admission_pools.items()}
+
+registry.gauge("chatr_llm_queue_depth", "Turns waiting for an LLM slot", ["model"],
+               callback=admission_stat("waiting"))
+registry.gauge("chatr_llm_active", "LLM generations in progress", ["model"],
+               callback=admission_stat("active"))
+registry.counter("chatr_turns_shed_total", "Turns answered with a holding response because the LLM was overloaded",
+                 ["model"], callback=admission_stat("shed"))
+registry.counter("chatr_turns_degraded_total", "Turns answered with a shortened generation", ["model"],
+                 callback=admission_stat("degraded"))
+INTENT_TURNS = registry.counter("chatr_intent_turns_total", "Turns answered by the intent router", ["intent"])
+registry.gauge("chatr_llm_free_turn_ratio", "Share of turns answered without the LLM",
+               callback=lambda: intent_router.stats()["share"])
+registry.gauge("chatr_active_calls", "Calls with conversation history in memory",
+               callback=lambda: session_store.stats()["sessions"])
+registry.counter("chatr_session_summaries_total", "Times older turns were folded into a call summary",
+                 callback=lambda: session_store.stats()["summaries"])
+registry.counter("chatr_response_cache_hits_total", "Response cache hits",
+                 callback=lambda: response_cache.stats()["hits"])
+registry.counter("chatr_response_cache_misses_total", "Response cache misses",
+                 callback=lambda: response_cache.stats()["misses"])
+registry.counter("chatr_speculation_started_total", "Speculative generations started from partial speech",
+                 callback=lambda: speculator.stats()["started"])
+registry.counter("chatr_speculation_hits_total", "Final transcripts answered by a speculative generation",
+                 callback=lambda: speculator.stats()["hits"])
+registry.counter("chatr_speculation_misses_total", "Final transcripts that differed from the speculated one",
+                 callback=lambda: speculator.stats()["misses"])
+registry.gauge("chatr_mqtt_publish_queue_depth", "Messages waiting in the MQTT publish queue",
+               callback=lambda: mqtt_component.value.publish_stats()["queue_depth"])
+registry.counter("chatr_mqtt_publish_dropped_total", "Messages dropped by the MQTT publish queue",
+                 callback=lambda: mqtt_component.value.publish_stats()["dropped"])
+
+def record_generation(text, seconds, model=OLLAMA_MODEL):
+    """Record latency and approximate token throughput for one LLM generation."""
+    tokens = SessionStore.estimate_tokens(text)
+    LLM_TOKENS.inc(tokens, model=model)
+    LLM_LATENCY.observe(seconds, model=model)
+    if seconds > 0:
+        LLM_TOKENS_PER_SECOND.observe(tokens / seconds, model=model)
+
+# Call statuses after which a session can be discarded
+TERMINAL_CALL_STATUSES = ("completed", "failed", "busy", "no-answer", "canceled")
+
+def get_response(speech_result, digits, call_sid=None, deadline=None):
+    """Get appropriate response based on input.
+
+    Raises Overloaded if the LLM can't answer before the deadline.
+    """
+    conversation_chain = get_conversation_chain()
     if speech_result and conversation_chain:
-        return conversation_chain.invoke({
-            "input": speech_result,
-            "chat_history": chat_history
-        })
+        if deadline is None:
+            deadline = time.monotonic() + TURN_DEADLINE
+        chat_history = session_store.get_history(call_sid)
+        cache_key = response_cache.make_key(speech_result, SYSTEM_PROMPT, chat_history)
+        response = response_cache.get(cache_key)
+        if response is None and SPECULATIVE_GENERATION:
+            # Never wait past the turn deadline; admit() below sheds the turn if nothing is left
+            wait = min(SPECULATION_WAIT_TIMEOUT, deadline - time.monotonic())
+            response = speculator.take(call_sid, speech_result, timeout=max(0.0, wait))
+            if response is not None:
+                # The speculation routed the same utterance; count it now it's answered
+                choose_model(speech_result, chat_history)
+                response_cache.put(cache_key, response)
+        if response is None:
+            model = choose_model(speech_result, chat_history)
+            pool = admission_pools[model]
+            mode = pool.admit(deadline)
+            model_keepers[model].touch()
+            started_at = time.perf_counter()
+            elapsed = None
+            try:
+                response = get_conversation_chain(model).invoke({
+                    "input": speech_result,
+                    "chat_history": chat_history
+                }, config=generation_config(mode))
+                elapsed = time.perf_counter() - started_at
+            finally:
+                pool.release(mode, elapsed)
+            record_generation(response, elapsed, model)
+            # Shortened answers aren't reused for calls that aren't under load
+            if mode == "full":
+                response_cache.put(cache_key, response)
+        session_store.append_turn(call_sid, speech_result, response)
+        return response
     elif digits:
         return f"You pressed: {digits}"
     else:
         return "No input received."
 
-@app.route("/status_callback", methods=['POST'])
-def status_callback():
-    """Handle Twilio call status updates and recording completions."""
+def answer_intent(intent, call_sid):
+    """Build the TwiML for a turn answered by the intent router."""
+    twilio_handler = get_twilio_handler()
+    message = intent.message
+    if intent.action == "hangup":
+        response = twilio_handler.create_hangup_response(message)
+    elif intent.action == "transfer":
+        response = twilio_handler.create_transfer_response(intent.number, message)
+    else:
+        if intent.action == "replay":
+            message = session_store.last_response(call_sid) or "Sorry, I haven't said anything yet. How can I help?"
+        response = twilio_handler.create_voice_response(message=message)
+    publish({
+        'type': 'agent_response',
+        'agent': message,
+        'intent': intent.name,
+        'action': intent.action,
+        'CallSid': call_sid,
+        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    })
+    return str(response)
+
+def is_cached(speech_result, call_sid):
+    """Check whether a full answer for this utterance is already cached."""
+    chat_history = session_store.get_history(call_sid)
+    return response_cache.contains(
+        response_cache.make_key(speech_result, SYSTEM_PROMPT, chat_history)
+    )
+
+def stream_response(speech_result, call_sid, mode="full", model=OLLAMA_MODEL):
+    """Start a streaming generation whose sentences are served as they complete.
+
+    The slot taken in model's admission pool is released when the generation ends.
+    """
+    chat_history = session_store.get_history(call_sid)
+    cache_key = response_cache.make_key(speech_result, SYSTEM_PROMPT, chat_history)
+    started_at = time.perf_counter()
+
+    def on_complete(text, completed):
+        record_generation(text, time.perf_counter() - started_at, model)
+        # A failed generation's text is truncated; keep it out of the cache and history
+        if completed:
+            if mode == "full":
+                response_cache.put(cache_key, text)
+            # Don't bring back a session that ended while the answer streamed
+            session_store.append_turn(call_sid, speech_result, text, create=not chat_history)
+        publish({
+            'type': 'agent_response',
+            'agent': text,
+            'CallSid': call_sid,
+            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+    def chunks():
+        # The webhook records the time to the first sentence in the pool's estimates
+        try:
+            yield from conversation_chain.stream({
+                "input": speech_result,
+                "chat_history": chat_history
+            }, config=generation_config(mode))
+        finally:
+            admission_pools[model].release(mode)
+
+    conversation_chain = get_conversation_chain(model)
+    model_keepers[model].touch()
+    return response_streamer.start(call_sid, chunks, on_complete=on_complete)
+
+def retry_attempt(data):
+    """The retry count from /retry-input's query string; malformed values count as a first attempt."""
+    try:
+        return max(0, int(data.get('attempt', 0)))
+    except (TypeError, ValueError):
+        return 0
+
+def hold_response(data):
+    """Ask the caller to hold while the turn is retried, up to ADMISSION_MAX_RETRIES times."""
+    attempt = retry_attempt(data) + 1
+    twilio_handler = get_twilio_handler()
+    if attempt > ADMISSION_MAX_RETRIES:
+        logger.warning(f"Giving up on turn after {attempt - 1} retries under load")
+        return str(twilio_handler.create_voice_response(message=BUSY_MESSAGE))
+    # Twilio's redirect only sends call parameters, so the input rides along in the URL
+    query = urlencode({
+        "attempt": attempt,
+        "SpeechResult": data.get('SpeechResult', ''),
+        "Digits": data.get('Digits', '')
+    })
+    return str(twilio_handler.create_streaming_response(HOLD_MESSAGE, continue_path=f"/retry-input?{query}"))
+
+def streamed_twiml(stream, deadline=None):
+    """Build TwiML for the next buffered sentences of a streaming response.
+
+    With a deadline, the wait for sentences stops there; Twilio then
+    redirects to /continue-response for whatever follows.
+    """
+    timeout = STREAM_WAIT_TIMEOUT
+    if deadline is not None:
+        timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+    sentences, finished = stream.next_sentences(timeout=timeout)
+    message = " ".join(sentences)
+    twilio_handler = get_twilio_handler()
+    if finished:
+        response_streamer.discard(stream.call_sid)
+        return twilio_handler.create_voice_response(message=message)
+    return twilio_handler.create_streaming_response(message)
+
+def handle_status_update(data):
+    """Publish a call status update and clean up finished calls."""
+    with call_context(data.get('CallSid')):
+        return _handle_status_update(data)
+
+def _handle_status_update(data):
     try:
-        data = request.form.to_dict()
         data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         data['type'] = 'status_update'
         
+        # A backed-up publish queue only needs a call's latest progress status;
+        # terminal statuses and recording callbacks are always sent
+        coalesce_key = None
+        if data.get('CallStatus') not in TERMINAL_CALL_STATUSES and 'RecordingSid' not in data:
+            coalesce_key = f"status:{data.get('CallSid')}"
         try:
-            mqtt_handler.publish(data)
-            logger.info(f"Published status update: {data['CallStatus']}")
+            publish(data, coalesce_key=coalesce_key)
+            logger.info("Published status update: %s", data['CallStatus'])
         except Exception as e:
             logger.error(f"Failed to publish status to MQTT: {e}")
+
+        if data.get('CallStatus') in TERMINAL_CALL_STATUSES:
+            # Stop the stream first so it can't record its turn after the session ends
+            response_streamer.discard(data.get('CallSid'), cancel=True)
+            session_store.end_session(data.get('CallSid'))
+            speculator.discard(data.get('CallSid'))
         
-        return jsonify({"status": "success", "message": "Status update processed"}), 200
+        return {"status": "success", "message": "Status update processed"}, 200
         
     except Exception as e:
         logger.error(f"Status callback error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        ERRORS.inc(route="status_callback")
+        return {"status": "error", "message": str(e)}, 500
+
+def handle_input(data, received_at=None):
+    """Answer one caller turn and return the TwiML and HTTP status.
 
-@app.route("/process-input", methods=['POST'])
-def process_input():
-    """Process voice and DTMF input from Twilio."""
+    received_at is the time.monotonic() at which the server received the
+    request, if it was queued before reaching this worker.
+    """
+    IN_FLIGHT.inc(route="process-input")
+    try:
+        with TURN_LATENCY.time(), call_context(data.get('CallSid')), profiler.sampled("process-input"):
+            body, status = _handle_input(data, received_at)
+    finally:
+        IN_FLIGHT.dec(route="process-input")
+    if status >= 500:
+        ERRORS.inc(route="process-input")
+    return body, status
+
+def _handle_input(data, received_at=None):
+    # Twilio's timeout runs from when the request arrived, including any wait for a worker
+    deadline = (received_at if received_at is not None else time.monotonic()) + TURN_DEADLINE
+    retry = retry_attempt(data) > 0
     ollm_resp = {}
     ollm_resp['date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     try:
-        content_type = request.headers.get('Content-Type')
-
-        if 'application/json' in str(content_type).lower():
-            data = request.get_json()
-        elif 'application/x-www-form-urlencoded' in str(content_type).lower():
-            data = request.form.to_dict()
-        else:
-            logger.warning(f"Received unsupported Content-Type: {content_type}")
-            return jsonify({"error": f"Unsupported Content-Type: {content_type}"}), 415
-
         # Add message type and timestamp
         data['type'] = 'user_input'
         data['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        # Publish to MQTT
-        try:
-            mqtt_handler.publish(data)
-            logger.info("Published user input to MQTT")
-        except Exception as e:
-            logger.error(f"Failed to publish input to MQTT: {e}")
+        # Publish to MQTT; a retried turn was published on its first attempt
+        if not retry:
+            try:
+                with STAGE_LATENCY.time(stage="publish_input"):
+                    publish(data)
+                logger.info("Published user input to MQTT")
+            except Exception as e:
+                logger.error(f"Failed to publish input to MQTT: {e}")
 
         # Process the response
         speech_result = data.get('SpeechResult', '')
         digits = data.get('Digits', '')
+        call_sid = data.get('CallSid')
+
+        # A retried turn already went past the router
+        intent = intent_router.route(speech_result, digits) if not retry else None
+        if intent is not None:
+            INTENT_TURNS.inc(intent=intent.name)
+            speculator.discard(call_sid)
+            with STAGE_LATENCY.time(stage="intent"):
+                return answer_intent(intent, call_sid), 200
 
-        llm_response = get_response(speech_result, digits)
+        if STREAM_RESPONSES and speech_result and get_conversation_chain() and call_sid \
+                and not is_cached(speech_result, call_sid) \
+                and not (SPECULATIVE_GENERATION and speculator.matches(call_sid, speech_result)):
+            speculator.discard(call_sid)
+            model = choose_model(speech_result, session_store.get_history(call_sid))
+            pool = admission_pools[model]
+            mode = pool.admit(deadline)
+            with STAGE_LATENCY.time(stage="first_sentence"):
+                started_at = time.perf_counter()
+                stream = stream_response(speech_result, call_sid, mode, model)
+                response = str(streamed_twiml(stream, deadline))
+                # Only the first sentence races the webhook timeout, so that's what the pool learns
+                pool.observe(mode, time.perf_counter() - started_at)
+                return response, 200
+
+        with STAGE_LATENCY.time(stage="llm"):
+            llm_response = get_response(speech_result, digits, call_sid, deadline)
         ollm_resp['type'] = 'agent_response'
         ollm_resp['agent'] = llm_response
-        mqtt_handler.publish(ollm_resp)
+        ollm_resp['CallSid'] = call_sid
+        with STAGE_LATENCY.time(stage="publish_response"):
+            publish(ollm_resp)
         
-        response = twilio_handler.create_voice_response(
-            message=llm_response
-        )
+        with STAGE_LATENCY.time(stage="twiml"):
+            response = str(get_twilio_handler().create_voice_response(
+                message=llm_response
+            ))
+
+        return response, 200
 
-        return str(response), 200
+    except Overloaded:
+        logger.warning("LLM overloaded, asking the caller to hold")
+        return hold_response(data), 200
     
     except Exception as e:
         logger.error(f"Error in process_input: {e}")
-        error_response = twilio_handler.create_voice_response(
+        error_response = get_twilio_handler().create_voice_response(
             message="Sorry, something went wrong. Let's try again."
         )
         return str(error_response), 500
 
-# Connect to MQTT broker when starting the application
-try:
-    mqtt_handler.connect()
-except Exception as e:
-    logger.error(f"Failed to initialize MQTT connection: {e}")
+# Shared secret for /admin/profile; the endpoint is disabled when unset
+PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN")
+
+def handle_profile_command(token, data):
+    """Start, stop or report on the sampling profiler for an authorized admin."""
+    if not PROFILER_ADMIN_TOKEN or not token or not hmac.compare_digest(token, PROFILER_ADMIN_TOKEN):
+        return {"status": "error", "message": "forbidden"}, 403
+    action = data.get('action', 'status')
+    result = {}
+    if action == "start":
+        sample_rate = float(data['sample_rate']) if data.get('sample_rate') else None
+        duration = float(data['duration']) if data.get('duration') else None
+        if not profiler.start(sample_rate=sample_rate, duration=duration):
+            return {"status": "error", "message": "profiler already running"}, 409
+    elif action == "stop":
+        result['reports'] = profiler.stop()
+    elif action != "status":
+        return {"status": "error", "message": f"unknown action: {action}"}, 400
+    return {"status": "success", **profiler.status(), **result}, 200
+
+def handle_continue(call_sid):
+    """Serve the next part of a streaming response for a call."""
+    with call_context(call_sid):
+        return _handle_continue(call_sid)
+
+def _handle_continue(call_sid):
+    try:
+        stream = response_streamer.get(call_sid)
+        if stream is None:
+            return str(get_twilio_handler().create_voice_response(message="")), 200
+        return str(streamed_twiml(stream)), 200
+
+    except Exception as e:
+        logger.error(f"Error in continue_response: {e}")
+        ERRORS.inc(route="continue-response")
+        error_response = get_twilio_handler().create_voice_response(
+            message="Sorry, something went wrong. Let's try again."
+        )
+        return str(error_response), 500
+
+def handle_partial_speech(data):
+    """Start speculative generation from a stable partial transcript."""
+    call_sid = data.get('CallSid')
+    with call_context(call_sid):
+        try:
+            # Speculation is extra LLM work; skip it while turns are queueing
+            if SPECULATIVE_GENERATION and not any(pool.saturated() for pool in admission_pools.values()):
+                speculator.on_partial(
+                    call_sid,
+                    data.get('StableSpeechResult', ''),
+                    session_store.get_history(call_sid)
+                )
+            return {"status": "success"}, 200
+        except Exception as e:
+            logger.error(f"Partial speech error: {e}")
+            ERRORS.inc(route="partial-speech")
+            return {"status": "error", "message": str(e)}, 500
+
+def create_app():
+    """Create the Flask application serving the Twilio webhooks."""
+    with startup_report.phase("flask_app"):
+        app = Flask(__name__)
+
+    @app.route("/status_callback", methods=['POST'])
+    def status_callback():
+        """Handle Twilio call status updates and recording completions."""
+        body, status = handle_status_update(request.form.to_dict())
+        return jsonify(body), status
+
+    @app.route("/process-input", methods=['POST'])
+    def process_input():
+        """Process voice and DTMF input from Twilio."""
+        try:
+            content_type = request.headers.get('Content-Type')
+
+            with STAGE_LATENCY.time(stage="parse"):
+                if 'application/json' in str(content_type).lower():
+                    data = request.get_json()
+                elif 'application/x-www-form-urlencoded' in str(content_type).lower():
+                    data = request.form.to_dict()
+                else:
+                    data = None
+            if data is None:
+                logger.warning(f"Received unsupported Content-Type: {content_type}")
+                return jsonify({"error": f"Unsupported Content-Type: {content_type}"}), 415
+
+        except Exception as e:
+            logger.error(f"Error in process_input: {e}")
+            ERRORS.inc(route="process-input")
+            error_response = get_twilio_handler().create_voice_response(
+                message="Sorry, something went wrong. Let's try again."
+            )
+            return str(error_response), 500
+
+        return handle_input(data)
+
+    @app.route("/retry-input", methods=['POST'])
+    def retry_input():
+        """Retry a turn that was deferred under load; the input is in the query string."""
+        data = request.form.to_dict()
+        data.update(request.args.to_dict())
+        return handle_input(data)
+
+    @app.route("/continue-response", methods=['POST'])
+    def continue_response():
+        """Serve the remaining sentences of a streaming response."""
+        return handle_continue(request.form.get('CallSid'))
+
+    @app.route("/partial-speech", methods=['POST'])
+    def partial_speech():
+        """Receive Gather partial transcripts and speculate on the answer."""
+        body, status = handle_partial_speech(request.form.to_dict())
+        return jsonify(body), status
+
+    @app.route("/metrics", methods=['GET'])
+    def prometheus_metrics():
+        """Expose latency histograms and counters in Prometheus text format."""
+        return registry.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+    @app.route("/admin/profile", methods=['POST'])
+    def admin_profile():
+        """Control the sampling profiler; requires the X-Admin-Token header."""
+        data = request.get_json(silent=True) or request.form.to_dict()
+        body, status = handle_profile_command(request.headers.get('X-Admin-Token'), data)
+        return jsonify(body), status
+
+    @app.route("/health", methods=['GET'])
+    def health():
+        """Report component status and the startup timing breakdown."""
+        report = startup_report.summary()
+        mqtt_handler = mqtt_component.value
+        report['mqtt_connected'] = bool(mqtt_handler and mqtt_handler.connected)
+        return jsonify(report), 200
+
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    profiler.install_signal_handler()
+    warm_up_in_background()
+    app.run(host='0.0.0.0', port=5000, debug=True)
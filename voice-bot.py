@@ -1,24 +1,38 @@
 import streamlit as st
-import time
 import logging
+import os
 from mqtt_handler import MQTTHandler
 from twilio_handler import TwilioHandler
+from call_tracker import CallStateTracker
+from message_store import MessageStore
+from log_config import setup_logging
 from datetime import datetime
 import threading
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Live mode: how often the message panel refreshes and how many queued messages it takes per refresh
+REFRESH_INTERVAL = float(os.getenv("DASHBOARD_REFRESH_INTERVAL", 1))
+LIVE_BATCH_SIZE = int(os.getenv("DASHBOARD_BATCH_SIZE", 200))
+
 def initialize_session_state():
     """Initialize all session state variables."""
     if 'messages' not in st.session_state:
-        st.session_state.messages = []
-        logger.info("Initialized empty messages list in session state")
+        st.session_state.messages = MessageStore(
+            max_messages=int(os.getenv("DASHBOARD_MAX_MESSAGES", 1000)),
+            formatter=format_message
+        )
+        logger.info("Initialized empty message store in session state")
         
+    if 'call_tracker' not in st.session_state:
+        st.session_state.call_tracker = CallStateTracker()
+
     if 'mqtt_handler' not in st.session_state:
         logger.info("Initializing new MQTT handler")
-        st.session_state.mqtt_handler = MQTTHandler(client_id="streamlit-mqtt-client")
+        st.session_state.mqtt_handler = MQTTHandler.from_env("streamlit-mqtt-client")
+        st.session_state.mqtt_handler.add_listener(st.session_state.call_tracker.handle_message)
         try:
             st.session_state.mqtt_handler.connect()
             logger.info("MQTT handler connected successfully")
@@ -51,8 +65,11 @@ def display_debug_info():
         st.write("MQTT Status:", "Connected" if st.session_state.mqtt_handler.connected else "Disconnected")
         st.write("Queue Size:", st.session_state.mqtt_handler.message_queue.qsize())
         st.write("Total Messages:", len(st.session_state.messages))
-
-        st.write(st.session_state)
+        st.write("Tracked Calls:", len(st.session_state.messages.call_sids()))
+        st.write("Messages by Type:", {
+            msg_type: st.session_state.messages.count(msg_type=msg_type)
+            for msg_type in st.session_state.messages.types()
+        })
         
         if st.button("Test MQTT"):
             try:
@@ -107,68 +124,73 @@ def handle_call_initiation(phone_number, twilio_handler):
     try:
         call = twilio.make_call(phone_number)
         st.session_state.call_sid = call.sid
-        st.info(f"Call placed successfully! Call SID: {st.session_state.call_sid}")
-
-        prev_state = ""
-        # with st.spinner("Call in progress..."):
-        while True:
-            current_call = twilio.get_call_status(st.session_state.call_sid)
-            
-            if current_call.status != prev_state:
-                st.session_state.info_message = f"Current status: {current_call.status}"
-                prev_state = current_call.status
-                
-            if current_call.status in ["completed", "failed", "busy", "no-answer", "canceled"]:
-                if current_call.status == "completed":
-                    st.session_state.status_message = "Call completed successfully."
-                else:
-                    st.session_state.error_message = f"Call ended with status: {current_call.status}"
-                break
-                
-            time.sleep(5)
+        # Status changes arrive as MQTT status_update events from the server
+        st.session_state.call_tracker.track(call.sid, call.status)
+        st.session_state.info_message = f"Call placed successfully! Call SID: {call.sid}"
                     
     except Exception as e:
         st.session_state.error_message = f"Error placing call: {str(e)}"
         st.session_state.call_active = False
 
-def main():
-    st.title("Chatr Bot")
-    
-    # Initialize session state
-    initialize_session_state()
-    
-    # Display any persisted messages
-    if st.session_state.error_message:
-        st.error(st.session_state.error_message)
-    if st.session_state.status_message:
-        st.success(st.session_state.status_message)
-    if st.session_state.info_message:
-        st.info(st.session_state.info_message)
-    
-    # Display debug information
-    display_debug_info()
-    
-    # Update MQTT messages
+def refresh_stale_calls(twilio_handler):
+    """Fetch the status of calls whose status callbacks have gone quiet."""
+    st.session_state.call_tracker.refresh_stale(
+        lambda call_sid: twilio_handler.get_call_status(call_sid).status
+    )
+
+def update_call_status(twilio_handler):
+    """Reflect the tracked state of the current call in the status messages."""
+    tracker = st.session_state.call_tracker
+    refresh_stale_calls(twilio_handler)
+
+    if not st.session_state.call_active or not st.session_state.call_sid:
+        return
+    state = tracker.get(st.session_state.call_sid)
+    if state is None:
+        return
+
+    st.session_state.info_message = f"Current status: {state.status}"
+    if state.finished:
+        if state.status == "completed":
+            st.session_state.status_message = "Call completed successfully."
+        else:
+            st.session_state.error_message = f"Call ended with status: {state.status}"
+        st.session_state.call_active = False
+
+def display_message_panel():
+    """Drain new MQTT messages and render the message history."""
     mqtt_handler = st.session_state.mqtt_handler
-    if mqtt_handler.update_streamlit_state():
-        logger.info("New messages added to session state")
-    
-    # Phone number input and call initiation
-    phone_number = st.text_input("Enter phone number to call (E.164 format)", "+91")
+    if mqtt_handler.new_messages.is_set():
+        if mqtt_handler.update_streamlit_state(limit=LIVE_BATCH_SIZE):
+            logger.info("New messages added to session state")
+            st.session_state.last_refresh = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Redraw the whole page once the current call ends so the status banners update
+    if st.session_state.call_active and st.session_state.call_sid:
+        # Between full reruns only this fragment runs, so poll Twilio from here too
+        refresh_stale_calls(st.session_state.twilio_handler)
+        state = st.session_state.call_tracker.get(st.session_state.call_sid)
+        if state is not None:
+            if state.finished:
+                st.rerun()
+            st.caption(f"Current call status: {state.status}")
 
-    # Make Call button is disabled when a call is in progress
-    if st.button("📞 Make Call", help="Click to initiate a new call"):
-        st.session_state.call_active = True
-        handle_call_initiation(phone_number, st.session_state.twilio_handler)
-        st.rerun()
-    
     # Display messages with pagination
-    if st.session_state.messages:
+    store = st.session_state.messages
+    if store:
         st.subheader("Message History")
+
+        # Optional filter by call
+        call_sid = st.selectbox(
+            "Call",
+            [None] + store.call_sids(),
+            format_func=lambda sid: "All calls" if sid is None else sid,
+            key="call_filter"
+        )
         
         # Pagination setup
         messages_per_page = 5
-        total_messages = len(st.session_state.messages)
+        total_messages = store.count(call_sid=call_sid)
         # Calculate total pages needed to display all messages
         total_pages = total_messages // messages_per_page + (1 if total_messages % messages_per_page > 0 else 0)
         
@@ -193,11 +215,9 @@ def main():
         # Display page information for better user context
         st.caption(f"Showing messages {start_idx + 1} to {end_idx} of {total_messages}")
         
-        # Display messages for current page in chronological order
-        # Removed reversed() to show messages from oldest to newest
-        for msg in st.session_state.messages[start_idx:end_idx]:
-            formatted_msg = format_message(msg)
-            
+        # Display messages for current page in chronological order.
+        # Messages are formatted once when they enter the store.
+        for formatted_msg in store.page(page, messages_per_page, call_sid=call_sid):
             # Create an expander for each message
             with st.expander(
                 f"{formatted_msg.get('Time', 'Unknown Time')} - "
@@ -218,5 +238,36 @@ def main():
     with col2:
         st.write("Last refreshed:", st.session_state.last_refresh)
 
+def main():
+    st.title("Chatr Bot")
+    
+    # Initialize session state
+    initialize_session_state()
+    update_call_status(st.session_state.twilio_handler)
+    
+    # Display any persisted messages
+    if st.session_state.error_message:
+        st.error(st.session_state.error_message)
+    if st.session_state.status_message:
+        st.success(st.session_state.status_message)
+    if st.session_state.info_message:
+        st.info(st.session_state.info_message)
+    
+    # Display debug information
+    display_debug_info()
+    
+    # Phone number input and call initiation
+    phone_number = st.text_input("Enter phone number to call (E.164 format)", "+91")
+
+    # Make Call button is disabled when a call is in progress
+    if st.button("📞 Make Call", help="Click to initiate a new call"):
+        st.session_state.call_active = True
+        handle_call_initiation(phone_number, st.session_state.twilio_handler)
+        st.rerun()
+    
+    # Live mode re-runs only the message panel instead of the whole page
+    live = st.toggle("Live updates", value=True, key="live_updates")
+    st.fragment(display_message_panel, run_every=REFRESH_INTERVAL if live else None)()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file